@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from typing import List, TYPE_CHECKING
+from typing import List, Tuple, TYPE_CHECKING
 
 import cv2
 import datetime
 import os
+import threading
 from logging import getLogger, DEBUG, NullHandler
 
+from Clock import RealClock, default_clock
+from VirtualDevices import FrameSourceCapture
+
 if TYPE_CHECKING:
     import numpy
 
@@ -55,12 +59,29 @@ def _get_save_filespec(filename: str) -> str:
 
 
 class Camera:
-    def __init__(self, fps: int = 45):
+    def __init__(self, fps: int = 45, use_grabber: bool = False):
         self.camera = None
         self.capture_size = (1280, 720)
         # self.capture_size = (1920, 1080)
         self.capture_dir = "Captures"
         self.fps = int(fps)
+        self.image_bgr = None
+        self.clock = default_clock  # フレームの取得時刻に使用する時計
+
+        # フレーム取得スレッド(grabber)の設定
+        # 最新フレームは(画像, 通し番号, 取得時刻)のタプルとして1つの属性に丸ごと代入する。
+        # 属性の代入はアトミックなので、読み出し側はロックなしで一貫した組を取得できる。
+        self.use_grabber = use_grabber
+        self._latest_frame = (None, 0, 0.0)
+        # grabberの起動直後に最初のフレームが届くのを待つ最大時間(s)
+        self.first_frame_timeout = 5.0
+        # grabberの停止を待つ最大時間(s)
+        self.grabber_stop_timeout = 1.0
+        self._grabber_thread = None
+        self._grabber_camera = None  # grabberが読み込んでいるデバイス
+        self._grabber_stop = threading.Event()  # grabberごとに作成する
+        # 新しいフレームを待つ側(wait_for_new_frame)への通知用
+        self._frame_cond = threading.Condition()
 
         self._logger = getLogger(__name__)
         self._logger.addHandler(NullHandler())
@@ -71,6 +92,7 @@ class Camera:
         if self.camera is not None and self.camera.isOpened():
             self._logger.debug("Camera is already opened")
             self.destroy()
+        self._clearLatestFrame()
 
         if os.name == "nt":
             self._logger.debug("NT OS")
@@ -91,15 +113,174 @@ class Camera:
         self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_size[0])
         self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_size[1])
 
+        if self.use_grabber:
+            self.startGrabber()
+
     # self.camera.set(cv2.CAP_PROP_SETTINGS, 0)
 
+    def openVirtualCamera(self, source: str, speed: float = 1.0, loop: bool = True, clock: RealClock = default_clock):
+        """
+        動画ファイルまたは画像フォルダをカメラとして開く(キャプチャボードを使用しない動作確認用)
+        フレームは設定されたfpsで返される。speedを指定すると再生速度を変更できる。
+        clockにVirtualClockを指定すると仮想的な時刻に応じたフレームを返す(フレーム取得スレッドは使用しない)。
+        """
+        if self.camera is not None and self.camera.isOpened():
+            self._logger.debug("Camera is already opened")
+            self.destroy()
+        self._clearLatestFrame()
+
+        self.clock = clock
+        self.camera = FrameSourceCapture(source, fps=self.fps, speed=speed, loop=loop, clock=clock)
+        if not self.camera.isOpened():
+            self._logger.error(f"Virtual camera {source} cannot open.")
+            return
+        self._logger.debug(f"Virtual camera {source} opened successfully.")
+
+        # 仮想的な時刻ではフレーム取得スレッドが時刻を進めてしまうため、同期読み込みのみとする
+        if self.use_grabber and not clock.is_virtual:
+            self.startGrabber()
+
     def isOpened(self):
         self._logger.debug("Camera is opened")
         return self.camera.isOpened()
 
-    def readFrame(self):
-        _, self.image_bgr = self.camera.read()
-        return self.image_bgr
+    def startGrabber(self):
+        """
+        フレーム取得スレッドを起動する。
+        起動後はスレッドがデバイスを占有し、readFrameは最新フレームを待たずに返す。
+        """
+        if self.isGrabberRunning():
+            return
+        if self.camera is None or not self.camera.isOpened():
+            self._logger.warning("Frame grabber cannot start: camera is not opened.")
+            return
+        if not self.stopGrabber():
+            self._logger.warning("Frame grabber cannot start: the previous grabber has not stopped.")
+            return
+
+        # 停止しなかった以前のgrabberが再開しないように、停止の通知はgrabberごとに作成する
+        self._grabber_stop = threading.Event()
+        self._grabber_camera = self.camera
+        self._grabber_thread = threading.Thread(
+            target=self._grabFrames, args=(self.camera, self._grabber_stop), name="CameraGrabber", daemon=True
+        )
+        self._grabber_thread.start()
+        self._logger.debug("Frame grabber started")
+
+    def stopGrabber(self) -> bool:
+        """
+        フレーム取得スレッドを停止する。停止した場合はTrueを返す。
+        スレッドがcamera.read()の途中でデバイスを解放するとバックエンドによってはクラッシュするため、
+        通常はスレッドが終了するまで待つ(読み込みは1フレーム分の時間で戻る)。
+        grabber_stop_timeoutの間に終了しない場合は、読み込みが戻らないとみなしてデバイスを解放し、読み込みを中断させる。
+        それでも終了しない場合はスレッドを保持したままFalseを返す(次回の呼び出しで再度停止を待つ)。
+        """
+        thread = self._grabber_thread
+        if thread is None:
+            return True
+        self._grabber_stop.set()
+        thread.join(timeout=self.grabber_stop_timeout)
+        if thread.is_alive():
+            self._logger.warning("Frame grabber does not stop. Release the camera to interrupt reading.")
+            if self._grabber_camera is not None:
+                self._grabber_camera.release()
+            thread.join(timeout=self.grabber_stop_timeout)
+        if thread.is_alive():
+            self._logger.error("Frame grabber is still running: camera.read() does not return.")
+            return False
+        self._grabber_thread = None
+        self._grabber_camera = None
+        self._logger.debug("Frame grabber stopped")
+        return True
+
+    def isGrabberRunning(self) -> bool:
+        return self._grabber_thread is not None and self._grabber_thread.is_alive() and not self._grabber_stop.is_set()
+
+    def _grabFrames(self, camera, stop: threading.Event):
+        """
+        フレーム取得スレッドの本体。
+        取得したフレームに単調増加の通し番号と取得時刻を付けて公開する。
+        """
+        _, seq, _ = self._latest_frame
+        while not stop.is_set():
+            ret, frame = camera.read()
+            if stop.is_set():
+                # 停止後に戻った読み込みのフレームは公開しない
+                break
+            if not ret or frame is None:
+                # デバイスからの読み込みに失敗した場合は1フレーム分待って再試行する
+                stop.wait(1.0 / self.fps)
+                continue
+            seq += 1
+            self._latest_frame = (frame, seq, self.clock.now())
+            with self._frame_cond:
+                self._frame_cond.notify_all()
+
+    def _clearLatestFrame(self):
+        """
+        以前のデバイスのフレームを返さないように最新フレームを破棄する。
+        通し番号は新しいフレームを待っている側(min_seq)のためにリセットせずに引き継ぐ。
+        """
+        with self._frame_cond:
+            _, seq, _ = self._latest_frame
+            self._latest_frame = (None, seq, 0.0)
+
+    @property
+    def frame_seq(self) -> int:
+        """
+        最新フレームの通し番号(フレームを取得するたびに1ずつ増える)
+        """
+        return self._latest_frame[1]
+
+    @property
+    def frame_timestamp(self) -> float:
+        """
+        最新フレームの取得時刻(clockの時刻, 通常はtime.perf_counter基準)
+        """
+        return self._latest_frame[2]
+
+    def wait_for_new_frame(self, last_seq: int, timeout: float = None) -> bool:
+        """
+        通し番号がlast_seqより新しいフレームが届くまで待機する。
+        タイムアウトした場合はFalseを返す。
+        """
+        if not self.isGrabberRunning():
+            # 同期読み込みの場合は読み込むたびに新しいフレームになるため待つ必要はない
+            return True
+        with self._frame_cond:
+            return self._frame_cond.wait_for(lambda: self._latest_frame[1] > last_seq, timeout=timeout)
+
+    def readFrameWithSeq(self, min_seq: int = None, timeout: float = None) -> Tuple[numpy.ndarray, int, float]:
+        """
+        フレームを(画像, 通し番号, 取得時刻)の組で取得する。
+        min_seqを指定した場合は、通し番号がmin_seq以上のフレームが届くまで(最大timeout秒)待機する。
+        """
+        if self.isGrabberRunning():
+            if min_seq is not None and self._latest_frame[1] < min_seq:
+                self.wait_for_new_frame(min_seq - 1, timeout=timeout)
+            if self._latest_frame[0] is None:
+                # 開いた直後でまだフレームが届いていない場合は、同期読み込みと同様に最初のフレームを待つ
+                with self._frame_cond:
+                    self._frame_cond.wait_for(
+                        lambda: self._latest_frame[0] is not None,
+                        timeout=self.first_frame_timeout if timeout is None else timeout,
+                    )
+            frame, seq, timestamp = self._latest_frame
+            self.image_bgr = frame
+            return frame, seq, timestamp
+
+        _, frame = self.camera.read()
+        # プレビューとコマンドのスレッドが同時に読み込んでも通し番号が重複しないようにする
+        with self._frame_cond:
+            _, seq, _ = self._latest_frame
+            latest = (frame, seq + 1, self.clock.now())
+            self._latest_frame = latest
+        self.image_bgr = frame
+        return latest
+
+    def readFrame(self, min_seq: int = None, timeout: float = None):
+        frame, _, _ = self.readFrameWithSeq(min_seq=min_seq, timeout=timeout)
+        return frame
 
     def saveCapture(self, filename: str = None, crop: int = None, crop_ax: List[int] = None, img: numpy.ndarray = None):
         if crop_ax is None:
@@ -141,7 +322,11 @@ class Camera:
             self._logger.error(f"Capture Failed :{e}")
 
     def destroy(self):
-        if self.camera is not None and self.camera.isOpened():
-            self.camera.release()
+        self.stopGrabber()
+        if self.camera is not None:
+            # grabberの停止のために解放済みの場合もある
+            if self.camera.isOpened():
+                self.camera.release()
             self.camera = None
             self._logger.debug("Camera destroyed")
+        self._clearLatestFrame()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+コマンドの待機やフレームの取得に使用する時計
+
+・PrecisionSleeper: 大部分をtime.sleepで待機し、最後のわずかな時間のみビジーウェイトする高精度な待機
+・RealClock: 実際の時間(time.perf_counter)で動作する(待機にはPrecisionSleeperを使用する)
+・VirtualClock: 待機すると仮想的な時刻を進めてすぐに戻る(長時間のコマンドを短時間で動作確認するために使用する)
+
+VirtualClockを使用する場合は、コマンド・仮想カメラ・仮想シリアルポートに同じ時計を設定する。
+    clock = VirtualClock()
+    camera.openVirtualCamera("frames/", clock=clock)
+    sender.openVirtualSerial(LoopbackSerial(clock=clock))
+    command.clock = clock
+
+RealClockのPrecisionSleeperは待機の傾向からmarginを学習するため、
+待機の傾向が異なる処理(コマンドとフレームの読み込みなど)はforkで別の時計を使用する。
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+
+
+class PrecisionSleeper:
+    """
+    指定時刻の直前(margin)まではtime.sleepで待機し、残りの時間のみビジーウェイトする
+    time.sleepの遅れを計測してmarginを自動で調整するため、
+    CPUをほとんど使用せずにビジーウェイトと同程度の精度で待機できる。
+    待機の遅れ(指定時刻から実際に戻った時刻までの時間)の統計はgetStatsで取得できる。
+    """
+
+    def __init__(self, margin: float = 0.001, min_margin: float = 0.0002, max_margin: float = 0.02):
+        self.margin = margin
+        self.min_margin = min_margin
+        self.max_margin = max_margin
+        self.__lock = threading.Lock()
+        # time.sleepの遅れの平均と偏差(指数移動平均)
+        self.__overshoot_mean = margin / 2
+        self.__overshoot_dev = margin / 4
+        self.resetStats()
+
+    def resetStats(self):
+        """
+        統計をリセットする
+        """
+        with self.__lock:
+            self.count = 0
+            self.total_wait = 0.0
+            self.total_spin = 0.0
+            self.__lateness_sum = 0.0
+            self.__lateness_sq_sum = 0.0
+            self.max_lateness = 0.0
+
+    def sleep(self, seconds: float) -> float:
+        """
+        指定時間待機する
+        """
+        return self.sleepUntil(time.perf_counter() + seconds)
+
+    def sleepUntil(self, deadline: float) -> float:
+        """
+        指定時刻(time.perf_counter基準)まで待機し、指定時刻からの遅れ(s)を返す
+        """
+        start = time.perf_counter()
+        margin = self.margin
+        if deadline - start > margin:
+            target = deadline - margin
+            time.sleep(target - start)
+            self.__updateMargin(time.perf_counter() - target)
+        elif deadline > start:
+            # marginより短い待機が続くとmarginが更新されないため、少しずつ小さくしてsleepを試す
+            with self.__lock:
+                self.margin = max(self.min_margin, self.margin * 0.99)
+        spin_start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            pass
+        end = time.perf_counter()
+        lateness = end - deadline
+        with self.__lock:
+            self.count += 1
+            self.total_wait += end - start
+            self.total_spin += end - spin_start
+            self.__lateness_sum += lateness
+            self.__lateness_sq_sum += lateness * lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+        return lateness
+
+    def __updateMargin(self, overshoot: float):
+        # 遅れの平均+4σをmarginとする(遅れがmarginを超えた場合のみ指定時刻を過ぎる)
+        with self.__lock:
+            self.__overshoot_mean += 0.1 * (overshoot - self.__overshoot_mean)
+            self.__overshoot_dev += 0.1 * (abs(overshoot - self.__overshoot_mean) - self.__overshoot_dev)
+            margin = self.__overshoot_mean + 4 * self.__overshoot_dev
+            self.margin = min(max(margin, self.min_margin), self.max_margin)
+
+    def getStats(self) -> dict:
+        """
+        待機回数、遅れの平均・標準偏差・最大(ms)、現在のmargin(ms)および待機時間のうちビジーウェイトした割合
+        """
+        with self.__lock:
+            count = self.count
+            mean = self.__lateness_sum / count if count else 0.0
+            variance = self.__lateness_sq_sum / count - mean * mean if count else 0.0
+            return {
+                "count": count,
+                "mean_lateness_ms": mean * 1000,
+                "stdev_lateness_ms": math.sqrt(max(variance, 0.0)) * 1000,
+                "max_lateness_ms": self.max_lateness * 1000,
+                "margin_ms": self.margin * 1000,
+                "spin_ratio": self.total_spin / self.total_wait if self.total_wait > 0 else 0.0,
+            }
+
+
+class RealClock:
+    """
+    実際の時間で動作する時計
+    """
+
+    is_virtual = False
+
+    def __init__(self, sleeper: PrecisionSleeper = None):
+        self.sleeper = sleeper if sleeper is not None else PrecisionSleeper()
+
+    def now(self) -> float:
+        """
+        現在時刻(s)を返す(time.perf_counter基準)
+        """
+        return time.perf_counter()
+
+    def sleep(self, seconds: float):
+        """
+        指定時間待機する
+        """
+        if seconds > 0:
+            self.sleeper.sleep(seconds)
+
+    def sleepUntil(self, deadline: float):
+        """
+        指定時刻(nowと同じ基準)まで待機する
+        """
+        if deadline > self.now():
+            self.sleeper.sleepUntil(deadline)
+
+    def getSleepStats(self) -> dict:
+        """
+        待機の精度の統計(PrecisionSleeper.getStats)
+        """
+        return self.sleeper.getStats()
+
+    def fork(self) -> RealClock:
+        """
+        同じ時刻で、待機には別のPrecisionSleeperを使用する時計を返す
+        """
+        return RealClock()
+
+
+class VirtualClock(RealClock):
+    """
+    仮想的な時刻で動作する時計
+    sleepは実際には待機せず、時刻を進めてすぐに戻るため、待機時間に関係なくコマンドを実行できる。
+    時刻は待機した時間だけ進み、処理にかかった実際の時間は含まれない(同じ入力に対して同じ時刻になる)。
+    """
+
+    is_virtual = True
+
+    def __init__(self, start: float = 0.0):
+        super().__init__()
+        self.__now = float(start)
+        self.__lock = threading.Lock()
+
+    def now(self) -> float:
+        return self.__now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.advance(seconds)
+
+    def sleepUntil(self, deadline: float):
+        with self.__lock:
+            if deadline > self.__now:
+                self.__now = float(deadline)
+
+    def fork(self) -> VirtualClock:
+        # 仮想的な時刻は共有する必要があるため同じ時計を返す
+        return self
+
+    def advance(self, seconds: float):
+        """
+        時刻を指定時間進める
+        """
+        with self.__lock:
+            self.__now += seconds
+
+
+# 時計を指定しない場合に使用する時計
+default_clock = RealClock()
@@ -4,16 +4,22 @@ from __future__ import annotations
 from typing import List, TYPE_CHECKING
 
 from abc import ABCMeta, abstractclassmethod
-import tkinter as tk
 import os
 
+try:
+    import tkinter as tk
+except ImportError:
+    tk = None
+
 from PokeConDialogue import (
     PokeConDialogue,
     generate_new_dialogue_list,
     save_dialogue_settings,
     get_settings_list,
     check_widget_name,
+    get_initial_values,
 )
+from TkStandIn import isTkAvailable
 from ExternalTools import SocketCommunications, MQTTCommunications
 
 if TYPE_CHECKING:
@@ -169,6 +175,23 @@ class Command:
         elif self.stdout_destination == "2":
             self.print_t2b(mode, *objects, sep=sep, end=end)
 
+    def show_dialogue(
+        self, title: str, message: int | str | list, desc: str = None, mode: int = 0, need: type = list
+    ) -> list | dict | bool:
+        """
+        ダイアログを表示して入力値を返す(Cancelの場合はFalse)
+        GUIを使用しない場合(tkinterが使用できない場合)はダイアログを表示せずに各widgetの初期値を返す
+        """
+        if not isTkAvailable():
+            print(f"Dialogue '{title}' is not shown without GUI. Use initial values.")
+            return get_initial_values(message, mode=mode, need=need)
+        self.message_dialogue = tk.Toplevel()
+        ret = PokeConDialogue(
+            self.message_dialogue, title, message, desc=desc, mode=mode, pos=int(self.pos_dialogue_buttons)
+        ).ret_value(need)
+        self.message_dialogue = None
+        return ret
+
     def dialogue(self, title: str, message: int | str | list, desc: str = None, need: type = list) -> list | dict:
         """
         保存機能なしのダイアログ(Entryのみ)
@@ -178,11 +201,7 @@ class Command:
         need: 出力する形式
         """
         # ダイアログ呼び出し
-        self.message_dialogue = tk.Toplevel()
-        ret = PokeConDialogue(
-            self.message_dialogue, title, message, desc=desc, pos=int(self.pos_dialogue_buttons)
-        ).ret_value(need)
-        self.message_dialogue = None
+        ret = self.show_dialogue(title, message, desc=desc, mode=0, need=need)
         if not ret:
             self.finish()
         else:
@@ -204,11 +223,7 @@ class Command:
             self.finish()
 
         # ダイアログ呼び出し
-        self.message_dialogue = tk.Toplevel()
-        ret = PokeConDialogue(
-            self.message_dialogue, title, dialogue_list, desc=desc, mode=1, pos=int(self.pos_dialogue_buttons)
-        ).ret_value(need)
-        self.message_dialogue = None
+        ret = self.show_dialogue(title, dialogue_list, desc=desc, mode=1, need=need)
 
         if not ret:
             self.finish()
@@ -253,11 +268,7 @@ class Command:
         new_dialogue_list = generate_new_dialogue_list(dialogue_list, filename)
 
         # ダイアログ呼び出し
-        self.message_dialogue = tk.Toplevel()
-        ret = PokeConDialogue(
-            self.message_dialogue, title, new_dialogue_list, desc=desc, mode=1, pos=int(self.pos_dialogue_buttons)
-        ).ret_value(need)
-        self.message_dialogue = None
+        ret = self.show_dialogue(title, new_dialogue_list, desc=desc, mode=1, need=need)
 
         if not ret:
             self.finish()
@@ -316,11 +327,7 @@ class Command:
         new_dialogue_list.append(["Check", "[PokeCon]設定を保存", False])
 
         # ダイアログ呼び出し
-        self.message_dialogue = tk.Toplevel()
-        ret = PokeConDialogue(
-            self.message_dialogue, title, new_dialogue_list, desc=desc, mode=1, pos=int(self.pos_dialogue_buttons)
-        ).ret_value(need)
-        self.message_dialogue = None
+        ret = self.show_dialogue(title, new_dialogue_list, desc=desc, mode=1, need=need)
 
         if not ret:
             self.finish()
@@ -5,8 +5,8 @@ from typing import TYPE_CHECKING
 
 import math
 import time
-from collections import OrderedDict
 from enum import Enum, IntEnum, IntFlag, auto
+from functools import lru_cache
 import queue
 from logging import getLogger, DEBUG, NullHandler
 
@@ -78,6 +78,11 @@ conversion_3ds_controller_button = {
     Button.WIRELESS: 0,
 }
 
+# ボタンのビットマスク(int)の変換表
+# Enum同士の演算は遅いため、送信データの作成時はintのビットマスクで計算する
+button_mask_default = {btn: int(value) for btn, value in conversion_default_button.items()}
+button_mask_3ds_controller = {btn: int(value) for btn, value in conversion_3ds_controller_button.items()}
+
 
 class Hat(IntEnum):
     TOP = 0  # 8
@@ -116,6 +121,97 @@ min = 0
 center = 128
 max = 255
 
+# スティックの値(0-255)を16進数の文字列に変換する表
+stick_hex = tuple(format(value, "x") for value in range(256))
+
+
+@lru_cache(maxsize=4096)
+def encodeDefault(btn: int, hat: int, lstick: tuple = None, rstick: tuple = None) -> str:
+    """
+    Default形式の送信データ(文字列)を作成する
+    lstick/rstickは変化した場合のみ(x, y)を指定する
+    同じ入力の状態に対しては作成済みの文字列を返す
+    """
+    send_btn = btn << 2
+    str_L = ""
+    str_R = ""
+    if lstick is not None:
+        send_btn |= 0x2
+        str_L = " " + stick_hex[lstick[0]] + " " + stick_hex[lstick[1]]
+    if rstick is not None:
+        send_btn |= 0x1
+        str_R = " " + stick_hex[rstick[0]] + " " + stick_hex[rstick[1]]
+    return format(send_btn, "#06x") + " " + str(hat) + str_L + str_R
+
+
+# Default (Binary)形式のヘッダ
+DEFAULT_BINARY_HEADER = 0xA5
+DEFAULT_BINARY_SIZE = 9
+
+
+@lru_cache(maxsize=4096)
+def encodeDefaultBinary(btn: int, hat: int, lstick: tuple = None, rstick: tuple = None) -> tuple:
+    """
+    Default形式の送信データを固定長(9byte)のバイナリで作成する(Default (Binary)形式)
+    [0xA5, ボタン(上位8bit), ボタン(下位8bit), ハット, LX, LY, RX, RY, チェックサム]
+    ボタンの16bitはDefault形式の先頭の値と同じ(下位2bitはスティックの値が変化したかどうか)
+    変化していないスティックの値は中央(0x80)とする
+    チェックサムはヘッダとチェックサムを除く7byteの排他的論理和
+    """
+    send_btn = btn << 2
+    lx, ly = center, center
+    rx, ry = center, center
+    if lstick is not None:
+        send_btn |= 0x2
+        lx, ly = lstick
+    if rstick is not None:
+        send_btn |= 0x1
+        rx, ry = rstick
+    payload = ((send_btn >> 8) & 0xFF, send_btn & 0xFF, hat, lx, ly, rx, ry)
+    checksum = 0
+    for value in payload:
+        checksum ^= value
+    return (DEFAULT_BINARY_HEADER,) + payload + (checksum,)
+
+
+def decodeDefaultBinary(data: bytes) -> str | None:
+    """
+    Default (Binary)形式の送信データをDefault形式の文字列に変換する(マイコン側の処理の参考・動作確認用)
+    ヘッダ・長さ・チェックサムが正しくない場合はNoneを返す
+    """
+    if len(data) != DEFAULT_BINARY_SIZE or data[0] != DEFAULT_BINARY_HEADER:
+        return None
+    checksum = 0
+    for value in data[1:-1]:
+        checksum ^= value
+    if checksum != data[-1]:
+        return None
+    send_btn = (data[1] << 8) | data[2]
+    row = format(send_btn, "#06x") + " " + str(data[3])
+    if send_btn & 0x2:
+        row += " " + stick_hex[data[4]] + " " + stick_hex[data[5]]
+    if send_btn & 0x1:
+        row += " " + stick_hex[data[6]] + " " + stick_hex[data[7]]
+    return row
+
+
+@lru_cache(maxsize=4096)
+def encodeQingpi(btn: int, hat: int, lx: int, ly: int, sx: int, sy: int) -> tuple:
+    """
+    Qingpi形式の送信データを作成する
+    """
+    return (0xAB, btn & 0xFF, (btn >> 8) & 0xFF, hat, lx, ly, center, center, sx & 0xFF, (sx >> 8) & 0xFF, sy)
+
+
+@lru_cache(maxsize=4096)
+def encode3DSController(btn: int, hat: int, lx: int, ly: int) -> tuple:
+    """
+    3DS Controller形式の送信データを作成する
+    """
+    send_lx = lx if lx >= 128 else 127 - lx
+    send_ly = ly if ly >= 128 else 127 - ly
+    return (0xA1, ((btn & 0xF) << 4) | convert_hat_3ds_controller[hat], (btn >> 4) & 0x3F, 0xA2, send_lx, send_ly)
+
 
 # serial format
 class SendFormat:
@@ -126,30 +222,33 @@ class SendFormat:
         self._logger.propagate = True
 
         # This format structure needs to be the same as the one written in Joystick.c
-        self.format = OrderedDict(
-            [
-                ("btn", 0),  # send bit array for buttons
-                ("hat", Hat.CENTER),
-                ("lx", center),
-                ("ly", center),
-                ("rx", center),
-                ("ry", center),
-                ("sx", 0),
-                ("sy", 0),
-            ]
-        )
+        # (dictは挿入順を保持する。入力ごとにコピーするためOrderedDictではなくdictを使用する)
+        self.format = {
+            "btn": 0,  # send bit array for buttons
+            "hat": Hat.CENTER,
+            "lx": center,
+            "ly": center,
+            "rx": center,
+            "ry": center,
+            "sx": 0,
+            "sy": 0,
+        }
 
         self.L_stick_changed = False
         self.R_stick_changed = False
         self.Hat_pos = Hat.CENTER
 
-    def setButton(self, btns, convert=conversion_default_button):
+    def setButton(self, btns, convert=button_mask_default):
+        mask = 0
         for btn in btns:
-            self.format["btn"] |= convert[btn]
+            mask |= convert[btn]
+        self.format["btn"] = int(self.format["btn"]) | int(mask)
 
-    def unsetButton(self, btns, convert=conversion_default_button):
+    def unsetButton(self, btns, convert=button_mask_default):
+        mask = 0
         for btn in btns:
-            self.format["btn"] &= ~convert[btn]
+            mask |= convert[btn]
+        self.format["btn"] = int(self.format["btn"]) & ~int(mask)
 
     def resetAllButtons(self):
         self.format["btn"] = 0
@@ -228,88 +327,52 @@ class SendFormat:
         self.format["sy"] = 0
 
     def convert2str(self):
-        str_format = ""
-        str_L = ""
-        str_R = ""
-        str_Hat = ""
-        space = " "
-
-        # set bits array with stick flags
-        send_btn = int(self.format["btn"]) << 2
-        # send_btn |= 0x3
-        if self.L_stick_changed:
-            send_btn |= 0x2
-            str_L = format(self.format["lx"], "x") + space + format(self.format["ly"], "x")
-        if self.R_stick_changed:
-            send_btn |= 0x1
-            str_R = format(self.format["rx"], "x") + space + format(self.format["ry"], "x")
-        # if self.Hat_changed:
-        str_Hat = str(int(self.format["hat"]))
-        # format(send_btn, 'x') + \
-        # print(hex(send_btn))
-        str_format = (
-            format(send_btn, "#06x")
-            + (space + str_Hat)
-            + (space + str_L if self.L_stick_changed else "")
-            + (space + str_R if self.R_stick_changed else "")
+        # 送信データは入力の状態ごとにencodeDefaultでキャッシュされる
+        fmt = self.format
+        str_format = encodeDefault(
+            int(fmt["btn"]),
+            int(fmt["hat"]),
+            (fmt["lx"], fmt["ly"]) if self.L_stick_changed else None,
+            (fmt["rx"], fmt["ry"]) if self.R_stick_changed else None,
         )
 
         self.L_stick_changed = False
         self.R_stick_changed = False
 
-        # print(str_format)
         return str_format  # the last space is not needed
 
+    def convert2binary(self):
+        """
+        For Default (Binary)
+        """
+        fmt = self.format
+        packet = encodeDefaultBinary(
+            int(fmt["btn"]),
+            int(fmt["hat"]),
+            (fmt["lx"], fmt["ly"]) if self.L_stick_changed else None,
+            (fmt["rx"], fmt["ry"]) if self.R_stick_changed else None,
+        )
+
+        self.L_stick_changed = False
+        self.R_stick_changed = False
+
+        return list(packet)
+
     def convert2list(self):
         """
         For Qingpi
         """
-        header = 0xAB  # fixed value
-        send_btn = int(self.format["btn"])
-        send_hat = int(self.format["hat"])
-        send_lstick_x = self.format["lx"]
-        send_lstick_y = self.format["ly"]
-        send_touch_x = int(self.format["sx"])
-        send_touch_y = int(self.format["sy"])
-
-        state = [
-            header,
-            send_btn & 0xFF,
-            (send_btn >> 8) & 0xFF,
-            send_hat,
-            send_lstick_x,
-            send_lstick_y,
-            center,
-            center,
-            send_touch_x & 0xFF,
-            (send_touch_x >> 8) & 0xFF,
-            send_touch_y,
-        ]
-
-        return state
+        fmt = self.format
+        return list(
+            encodeQingpi(int(fmt["btn"]), int(fmt["hat"]), fmt["lx"], fmt["ly"], int(fmt["sx"]), int(fmt["sy"]))
+        )
 
     def convert2list2(self):
         """
         For 3DS Controller
         """
-        header = 0xA1  # fixed value
-        send_btn = int(self.format["btn"])
-        send_hat = convert_hat_3ds_controller[int(self.format["hat"])]
-
-        header2 = 0xA2  # fixed value
-        send_lx = self.format["lx"] if self.format["lx"] >= 128 else 127 - self.format["lx"]
-        send_ly = self.format["ly"] if self.format["ly"] >= 128 else 127 - self.format["ly"]
-
-        state = [
-            header,
-            ((send_btn & 0xF) << 4) | send_hat,
-            (send_btn >> 4) & 0x3F,
-            header2,
-            send_lx,
-            send_ly,
-        ]
-
-        return state
+        fmt = self.format
+        return list(encode3DSController(int(fmt["btn"]), int(fmt["hat"]), fmt["lx"], fmt["ly"]))
 
 
 # This class handle L stick and R stick at any angles
@@ -422,6 +485,27 @@ class Touchscreen:
         self.y = y
 
 
+def splitInputs(btns: list) -> tuple:
+    """
+    入力の一覧をButton, Hat, Direction, Touchscreenごとの一覧に分ける
+    """
+    buttons = []
+    hats = []
+    directions = []
+    touchscreens = []
+    for btn in btns:
+        btn_type = type(btn)
+        if btn_type is Button:
+            buttons.append(btn)
+        elif btn_type is Hat:
+            hats.append(btn)
+        elif btn_type is Direction:
+            directions.append(btn)
+        elif btn_type is Touchscreen:
+            touchscreens.append(btn)
+    return buttons, hats, directions, touchscreens
+
+
 # handles serial input to Joystick.c
 
 
@@ -463,20 +547,21 @@ class KeyPress:
         for btn in self.holdButton:
             if btn not in btns:
                 btns.append(btn)
+        buttons, hats, directions, touchscreens = splitInputs(btns)
         if self.serial_data_format_name == "3DS Controller":
-            self.format.setButton(
-                [btn for btn in btns if type(btn) is Button], convert=conversion_3ds_controller_button
-            )
-            self.format.setHat([btn for btn in btns if type(btn) is Hat])
-            self.format.setAnyDirection([btn for btn in btns if type(btn) is Direction])
+            self.format.setButton(buttons, convert=button_mask_3ds_controller)
+            self.format.setHat(hats)
+            self.format.setAnyDirection(directions)
             self.ser.writeList(self.format.convert2list2())
         else:
-            self.format.setButton([btn for btn in btns if type(btn) is Button])
-            self.format.setHat([btn for btn in btns if type(btn) is Hat])
-            self.format.setAnyDirection([btn for btn in btns if type(btn) is Direction])
+            self.format.setButton(buttons)
+            self.format.setHat(hats)
+            self.format.setAnyDirection(directions)
             if self.serial_data_format_name == "Qingpi":
-                self.format.setTouchscreen([btn for btn in btns if type(btn) is Touchscreen])
+                self.format.setTouchscreen(touchscreens)
                 self.ser.writeList(self.format.convert2list())
+            elif self.serial_data_format_name == "Default (Binary)":
+                self.ser.writeList(self.format.convert2binary())
             else:
                 self.ser.writeRow(self.format.convert2str())
         self.input_time_0 = time.perf_counter()
@@ -492,31 +577,33 @@ class KeyPress:
             btns = [btns]
         # self._logger.debug(btns)
 
+        buttons, _, directions, touchscreens = splitInputs(btns)
+
         # get tilting direction from angles
         tilts = []
-        for dir in [btn for btn in btns if type(btn) is Direction]:
+        for dir in directions:
             tiltings = dir.getTilting()
             for tilting in tiltings:
                 tilts.append(tilting)
         # self._logger.debug(tilts)
 
         if self.serial_data_format_name == "3DS Controller":
-            self.format.unsetButton(
-                [btn for btn in btns if type(btn) is Button], convert=conversion_3ds_controller_button
-            )
+            self.format.unsetButton(buttons, convert=button_mask_3ds_controller)
             if unset_hat:
                 self.format.unsetHat()
             self.format.unsetDirection(tilts)
             self.ser.writeList(self.format.convert2list2())
         else:
-            self.format.unsetButton([btn for btn in btns if type(btn) is Button])
+            self.format.unsetButton(buttons)
             if unset_hat:
                 self.format.unsetHat()
             self.format.unsetDirection(tilts)
             if self.serial_data_format_name == "Qingpi":
-                if unset_Touchscreen or (True in [btn for btn in btns if type(btn) is Touchscreen]):
+                if unset_Touchscreen or (True in touchscreens):
                     self.format.unsetTouchscreen()
                 self.ser.writeList(self.format.convert2list())
+            elif self.serial_data_format_name == "Default (Binary)":
+                self.ser.writeList(self.format.convert2binary())
             else:
                 self.ser.writeRow(self.format.convert2str())
 
@@ -566,6 +653,9 @@ class KeyPress:
     def end(self):
         if self.serial_data_format_name in ["Qingpi", "3DS Controller"]:
             pass
+        elif self.serial_data_format_name == "Default (Binary)":
+            # "end"の代わりにすべてのボタンを離し、スティックを中央に戻した状態を送信する
+            self.ser.writeList(list(encodeDefaultBinary(0, int(Hat.CENTER), (center, center), (center, center))))
         else:
             self.ser.writeRow("end")
 
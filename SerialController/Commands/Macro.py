@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+入力の記録(マクロ)
+送信するデータ(シリアル通信のパケット)を事前に作成し、送信時刻とともにNPZファイルに保存する。
+再生時は作成済みのパケットを送信時刻どおりに送信するだけなので、長い入力でも時刻がずれにくく、CPUの使用率も低い。
+
+    compiler = MacroCompiler(serial_data_format_name="Default")
+    compiler.press(Button.A, duration=0.1, wait=0.5)
+    compiler.hold(Direction.UP)
+    compiler.wait(1.0)
+    compiler.holdEnd(Direction.UP)
+    compiler.compile().save("macro.npz")
+
+    # PythonCommand内で再生する
+    self.playMacro("macro.npz")
+"""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+import numpy
+from logging import getLogger, DEBUG, NullHandler
+
+from Clock import RealClock, default_clock
+from Commands.Keys import Button, Direction, Hat, KeyPress, Stick
+
+if TYPE_CHECKING:
+    from Commands.Sender import Sender
+
+MACRO_VERSION = 1
+
+
+class Macro:
+    """
+    送信時刻(開始からの経過時間, s)と送信するパケットの組の一覧
+    """
+
+    def __init__(self, timestamps: List[float], packets: List[bytes], serial_data_format_name: str = "Default"):
+        self._logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+
+        if len(timestamps) != len(packets):
+            raise ValueError("The number of timestamps and packets don't match.")
+        self.timestamps = numpy.asarray(timestamps, dtype="float64")
+        self.packets = [bytes(packet) for packet in packets]
+        self.serial_data_format_name = serial_data_format_name
+
+    def __len__(self) -> int:
+        return len(self.packets)
+
+    @property
+    def duration(self) -> float:
+        """
+        最初のパケットから最後のパケットまでの時間(s)
+        """
+        return float(self.timestamps[-1]) if len(self.timestamps) else 0.0
+
+    def save(self, filename: str):
+        """
+        NPZファイルに保存する
+        パケットは連結したバイト列(data)と各パケットの開始位置(offsets)として保存する
+        """
+        offsets = numpy.zeros(len(self.packets) + 1, dtype="int64")
+        numpy.cumsum([len(packet) for packet in self.packets], out=offsets[1:])
+        numpy.savez_compressed(
+            filename,
+            version=numpy.array(MACRO_VERSION),
+            serial_data_format_name=numpy.array(self.serial_data_format_name),
+            timestamps=self.timestamps,
+            offsets=offsets,
+            data=numpy.frombuffer(b"".join(self.packets), dtype="uint8"),
+        )
+
+    @classmethod
+    def load(cls, filename: str) -> Macro:
+        """
+        NPZファイルから読み込む
+        """
+        with numpy.load(filename) as npz:
+            if int(npz["version"]) > MACRO_VERSION:
+                raise ValueError(f"Unsupported macro version: {int(npz['version'])}")
+            offsets = npz["offsets"]
+            data = npz["data"].tobytes()
+            packets = [data[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+            return cls(npz["timestamps"], packets, serial_data_format_name=str(npz["serial_data_format_name"]))
+
+
+class _PacketRecorder:
+    """
+    KeyPressから送信されたデータを送信せずに記録するSender互換のオブジェクト
+    """
+
+    def __init__(self, compiler: MacroCompiler):
+        self.compiler = compiler
+
+    def writeRow(self, row: str, is_show: bool = False):
+        self.compiler.addPacket((row + "\r\n").encode("utf-8"))
+
+    def writeRow_wo_perf_counter(self, row: str, is_show: bool = False):
+        self.writeRow(row)
+
+    def writeList(self, values: list, is_show: bool = False):
+        self.compiler.addPacket(bytes(values))
+
+
+class MacroCompiler:
+    """
+    PythonCommandと同じ操作(press/hold/holdEnd/wait)からMacroを作成する
+    パケットはKeyPressで作成するため、実際にコマンドで操作した場合と同じデータになる
+    """
+
+    def __init__(self, serial_data_format_name: str = "Default"):
+        self.serial_data_format_name = serial_data_format_name
+        self.time = 0.0
+        self.timestamps = []
+        self.packets = []
+        self.keys = KeyPress(_PacketRecorder(self))
+        self.keys.serial_data_format_name = serial_data_format_name
+
+    def addPacket(self, packet: bytes, at: Optional[float] = None):
+        """
+        現在の時刻(atを指定した場合はその時刻)に送信するパケットを追加する
+        """
+        self.timestamps.append(self.time if at is None else at)
+        self.packets.append(packet)
+
+    def wait(self, wait: float):
+        self.time += wait
+
+    def press(self, buttons: Button | Hat | Stick | Direction, duration: float = 0.1, wait: float = 0.1):
+        # PythonCommand.pressと同じ呼び出し方にする(ホールド中のボタンの扱いも同じになる)
+        self.keys.input(buttons)
+        self.wait(duration)
+        self.keys.inputEnd(buttons)
+        self.wait(wait)
+
+    def pressRep(
+        self,
+        buttons: Button | Hat | Stick | Direction,
+        repeat: int,
+        duration: float = 0.1,
+        interval: float = 0.1,
+        wait: float = 0.1,
+    ):
+        for i in range(0, repeat):
+            self.press(buttons, duration, 0 if i == repeat - 1 else interval)
+        self.wait(wait)
+
+    def hold(self, buttons: Button | Hat | Stick | Direction, wait: float = 0.1):
+        self.keys.hold(buttons)
+        self.wait(wait)
+
+    def holdEnd(self, buttons: Button | Hat | Stick | Direction):
+        self.keys.holdEnd(buttons)
+
+    def addStickLog(self, filename: str, stick: Stick = Stick.LEFT):
+        """
+        1行ごとに「角度(度), 倒す量(0-1), 時間(s)」を記録したCSVをスティック操作として追加する(RecPlayの記録形式)
+        """
+        direction = None
+        with open(filename) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                angle, magnification, duration = map(float, line.strip().split(","))
+                direction = Direction(stick, angle, magnification)
+                self.keys.input(direction)
+                self.wait(duration)
+        if direction is not None:
+            self.keys.inputEnd(direction)
+
+    def compile(self) -> Macro:
+        """
+        追加した操作からMacroを作成する(送信時刻順に並べ替える)
+        """
+        order = sorted(range(len(self.packets)), key=lambda i: self.timestamps[i])
+        return Macro(
+            [self.timestamps[i] for i in order],
+            [self.packets[i] for i in order],
+            serial_data_format_name=self.serial_data_format_name,
+        )
+
+
+class MacroPlayer:
+    """
+    Macroのパケットを送信時刻どおりにSenderへ送信する
+    各パケットの送信時刻は開始時刻を基準に決まるため、送信にかかった時間が後のパケットに累積しない
+    """
+
+    def __init__(self, sender: Sender, clock: RealClock = default_clock):
+        self.sender = sender
+        self.clock = clock
+
+    def play(self, macro: Macro, start: Optional[float] = None, check: Optional[Callable[[], object]] = None) -> dict:
+        """
+        Macroを再生し、送信時刻の遅れの統計を返す
+        checkを指定した場合は各パケットの送信後に呼び出す(PythonCommand.checkAliveAndPauseなど)
+        checkが数値を返した場合は一時停止していた時間(s)として、以降のパケットの送信時刻をその分遅らせる
+        """
+        count = len(macro)
+        lateness = numpy.zeros(count, dtype="float64")
+        timestamps = macro.timestamps.tolist()
+        packets = macro.packets
+        clock = self.clock
+        write = self.sender.writeBytes
+        if start is None:
+            start = clock.now()
+        for i in range(count):
+            deadline = start + timestamps[i]
+            clock.sleepUntil(deadline)
+            write(packets[i])
+            lateness[i] = clock.now() - deadline
+            if check is not None:
+                paused = check()
+                if paused:
+                    start += paused
+
+        if count == 0:
+            return {"count": 0}
+        return {
+            "count": count,
+            "duration": macro.duration,
+            "mean_lateness_ms": float(lateness.mean() * 1000),
+            "p99_lateness_ms": float(numpy.percentile(lateness, 99) * 1000),
+            "max_lateness_ms": float(lateness.max() * 1000),
+        }
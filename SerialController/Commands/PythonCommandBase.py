@@ -21,13 +21,24 @@ try:
     flag_import_plyer = True
 except Exception:
     flag_import_plyer = False
+from Clock import default_clock
 from Settings import GuiSettings
-from ImageProcessing import ImageProcessing, crop_image, getImage, opneImage
+from ImageProcessing import (
+    ImageProcessing,
+    FrameCache,
+    TemplateCache,
+    compileROI,
+    crop_image,
+    doPreprocessImage,
+    getImage,
+    opneImage,
+)
 
 from LineNotify import Line_Notify
 from DiscordNotify import Discord_Notify
 from Commands import CommandBase
 from Commands.Keys import KeyPress
+from Commands.Macro import Macro, MacroPlayer
 
 if TYPE_CHECKING:
     from Window import PokeControllerApp
@@ -46,6 +57,8 @@ class StopThread(Exception):
 
 
 class PythonCommand(CommandBase.Command):
+    clock = default_clock  # 待機に使用する時計(VirtualClockを設定すると待機せずに時刻を進める)
+
     def __init__(self):
         super(PythonCommand, self).__init__()
         self._logger = getLogger(__name__)
@@ -57,6 +70,7 @@ class PythonCommand(CommandBase.Command):
         self.thread = None
         self.alive = True
         self.postProcess = None
+        self.timeline_report = []  # 最後に実行したrunTimelineの結果
         try:
             self.Line = Line_Notify()
         except Exception:
@@ -100,6 +114,8 @@ class PythonCommand(CommandBase.Command):
             "camera",
             "gui",
             "ImgProc",
+            "ImgProcGPU",
+            "timeline_report",
         ]
         print("--------内部変数一覧--------")
         for k, v in var_dict.items():
@@ -228,11 +244,78 @@ class PythonCommand(CommandBase.Command):
     ):
         """
         ボタンを複数回押す。
+        各入力の時刻は最初の入力の時刻を基準に決めるため、回数が多くても時刻がずれません。(runTimeline)
         """
-        for i in range(0, repeat):
-            self.press(buttons, duration, 0 if i == repeat - 1 else interval)
+        self.runTimeline([(i * (duration + interval), buttons, duration) for i in range(0, repeat)])
         self.wait(wait)
 
+    def playMacro(self, macro: Macro | str) -> dict:
+        """
+        Macro(または保存したNPZファイルのパス)を再生し、送信時刻の遅れの統計を返す。
+        """
+        if isinstance(macro, str):
+            macro = Macro.load(macro)
+        if macro.serial_data_format_name != self.keys.serial_data_format_name:
+            self._logger.warning(
+                f"Macro format '{macro.serial_data_format_name}' differs from '{self.keys.serial_data_format_name}'"
+            )
+        return MacroPlayer(self.keys.ser, clock=self.clock).play(macro, check=self.checkAliveAndPause)
+
+    def checkAliveAndPause(self) -> float:
+        """
+        Aliveフラグを確認し、一時停止中であれば再開されるまで待機する。
+        戻り値は一時停止していた時間(s)で、以降の入力の時刻を遅らせるために使用する。(runTimeline, playMacro)
+        """
+        self.checkIfAlive()
+        if not self.isPause:
+            return 0.0
+        paused = self.clock.now()
+        self.show_var()
+        while self.isPause:
+            sleep(0.5)
+            self.checkIfAlive()
+        return self.clock.now() - paused
+
+    def runTimeline(self, timeline: List[tuple], start: Optional[float] = None) -> List[dict]:
+        """
+        開始時刻からの経過時間を指定した入力の一覧を実行する。
+        timelineの要素は(開始時刻からの経過時間(s), ボタン, 押す時間(s, 省略時は0.1))です。
+        各入力は開始時刻を基準とした時刻に送信するため、送信やPythonの処理にかかった時間が後の入力に累積しません。
+        startを省略した場合は呼び出した時刻を開始時刻とします。(clock.now()の時刻)
+        戻り値は各イベント(押す/離す)の一覧で、予定時刻(offset)と実際の送信時刻の遅れ(lateness, s)を含みます。
+        一時停止した場合は、停止していた時間だけ以降の入力の時刻を遅らせます。
+        """
+        # 押す/離すイベントに分けて時刻順に並べる(同じ時刻の場合は離すイベントを先にする)
+        # 時刻は丸めてから比べる(i * (duration + interval) + durationなどの浮動小数点の誤差で
+        # 次の入力の後に前の入力を離すと、次の入力が取り消されるため)
+        events = []
+        for index, item in enumerate(timeline):
+            offset, buttons = item[0], item[1]
+            duration = item[2] if len(item) > 2 else 0.1
+            events.append((offset, 1, index, "input", buttons))
+            events.append((offset + duration, 0, index, "inputEnd", buttons))
+        events.sort(key=lambda event: (round(event[0], 9), event[1], event[2]))
+
+        if start is None:
+            start = self.clock.now()
+        report = []
+        for offset, _, index, action, buttons in events:
+            deadline = start + offset
+            self.clock.sleepUntil(deadline)
+            # KeyPressはlistを書き換えるためコピーを渡す
+            btns = list(buttons) if isinstance(buttons, list) else buttons
+            if action == "input":
+                self.keys.input(btns)
+            else:
+                self.keys.inputEnd(btns)
+            report.append({"index": index, "action": action, "offset": offset, "lateness": self.clock.now() - deadline})
+            start += self.checkAliveAndPause()
+
+        self.timeline_report = report
+        if report:
+            self._logger.debug(f"Timeline finished: max lateness {max(r['lateness'] for r in report) * 1000:.3f} ms")
+        return report
+
     # add hold buttons
     @pausedecorator
     def hold(self, buttons: Button | Hat | Stick | Direction, wait: float = 0.1):
@@ -257,9 +340,7 @@ class PythonCommand(CommandBase.Command):
         """
         指定時間待機する。
         """
-        current_time = time.perf_counter()
-        while time.perf_counter() < current_time + wait:
-            pass
+        self.clock.sleep(float(wait))
         self.checkIfAlive()
 
     # do nothing at wait time(s)
@@ -268,14 +349,16 @@ class PythonCommand(CommandBase.Command):
         """
         指定時間待機する。
         """
-        if float(wait) > 0.1:
-            sleep(wait)
-        else:
-            current_time = time.perf_counter()
-            while time.perf_counter() < current_time + wait:
-                pass
+        # 大部分をsleepで待機し、最後のわずかな時間のみビジーウェイトする(Clock.PrecisionSleeper)
+        self.clock.sleep(float(wait))
         self.checkIfAlive()
 
+    def getWaitStats(self) -> dict:
+        """
+        wait/short_waitの待機の精度(指定時間からの遅れ)の統計を返す。
+        """
+        return self.clock.getSleepStats()
+
     def checkIfAlive(self):
         """
         Aliveフラグの状態を確認する。
@@ -369,38 +452,21 @@ def convertCv2Format(crop_fmt: int | str = "", crop: List[int] = []) -> Tuple(Li
     crop_fmt=14: [y軸始点, トリミング後の画像のサイズ(縦), x軸始点, トリミング後の画像のサイズ(横)]
     """
 
+    # 変換結果はcompileROIでキャッシュされる
     try:
-        # pillow形式
-        if crop_fmt == 1 or crop_fmt == "1":
-            res_cv2 = [crop[1], crop[3], crop[0], crop[2]]
-        elif crop_fmt == 2 or crop_fmt == "2":
-            res_cv2 = [crop[1], crop[1] + crop[3], crop[0], crop[0] + crop[2]]
-        elif crop_fmt == 3 or crop_fmt == "3":
-            res_cv2 = [crop[2], crop[3], crop[0], crop[1]]
-        elif crop_fmt == 4 or crop_fmt == "4":
-            res_cv2 = [crop[2], crop[2] + crop[3], crop[0], crop[0] + crop[1]]
-        # opencv形式
-        elif crop_fmt == 11 or crop_fmt == "11":
-            res_cv2 = [crop[0], crop[2], crop[1], crop[3]]
-        elif crop_fmt == 12 or crop_fmt == "12":
-            res_cv2 = [crop[0], crop[0] + crop[2], crop[1], crop[1] + crop[3]]
-        elif crop_fmt == 13 or crop_fmt == "13":
-            res_cv2 = [crop[0], crop[1], crop[2], crop[3]]
-        elif crop_fmt == 14 or crop_fmt == "14":
-            res_cv2 = [crop[0], crop[0] + crop[1], crop[2], crop[2] + crop[3]]
-        else:
-            res_cv2 = [crop[1], crop[3], crop[0], crop[2]]
-        res_pillow = [res_cv2[2], res_cv2[0], res_cv2[3], res_cv2[1]]
+        roi = compileROI(crop_fmt, crop)
     except Exception:
-        res_cv2 = []
-        res_pillow = []
+        return [], []
 
-    return res_cv2, res_pillow
+    return list(roi.cv2), list(roi.pillow)
 
 
 class ImageProcPythonCommand(PythonCommand):
     template_path_name = "./Template/"
     capture_path_name = "./Captures/"
+    new_frame_timeout = 1.0  # 新しいフレームを待つ際のタイムアウト(s)
+    template_cache = TemplateCache(maxsize=128)  # 読み込み済みテンプレート画像のキャッシュ(全コマンドで共有)
+    last_location_margin = 16  # 前回の検出位置の周辺を探索する際の余白(px)
 
     def __init__(self, cam: Camera, gui: CaptureArea = None):
         super(ImageProcPythonCommand, self).__init__()
@@ -412,6 +478,12 @@ class ImageProcPythonCommand(PythonCommand):
 
         self.camera = cam
         self.gui = gui
+        self.last_frame_seq = 0  # 最後に画像認識等で使用したフレームの通し番号
+        self.frame_cache = FrameCache()  # 同一フレームに対する前処理結果のキャッシュ
+        self.last_match_loc = {}  # テンプレート画像ごとの前回の検出位置(トリミング前の画像上の座標)
+        self.last_location_stats = {}  # テンプレート画像ごとの前回の検出位置周辺での検出成否の回数
+        self.ImgProc = ImageProcessing()  # 画像認識に使用するImageProcessing(コマンド内で再利用する)
+        self.ImgProcGPU = None  # GPUを使用する場合のImageProcessing(必要になった時点で作成する)
 
     def pausedecorator2(func):
         """
@@ -472,6 +544,32 @@ class ImageProcPythonCommand(PythonCommand):
     def setTemplateDir(self, path):
         ImageProcPythonCommand.template_path_name = path
 
+    def wait_for_new_frame(self, timeout: float = None) -> bool:
+        """
+        前回使用したフレームよりも新しいフレームが届くまで待機します。
+        タイムアウトした場合はFalseを返します。
+        """
+        if timeout is None:
+            timeout = self.new_frame_timeout
+        res = self.camera.wait_for_new_frame(self.last_frame_seq, timeout=timeout)
+        self.checkIfAlive()
+        return res
+
+    def readFrame(self, wait_new_frame: bool = False) -> ImageProcessing.image_type:
+        """
+        カメラからフレームを取得し、使用したフレームの通し番号を記録します。
+        wait_new_frameがTrueの場合は前回使用したフレームより新しいフレームが届くまで待機します。
+        """
+        if wait_new_frame:
+            src, seq, _ = self.camera.readFrameWithSeq(min_seq=self.last_frame_seq + 1, timeout=self.new_frame_timeout)
+            if seq <= self.last_frame_seq:
+                self._logger.debug("Timed out waiting for a new frame. The previous frame is reused.")
+        else:
+            src, seq, _ = self.camera.readFrameWithSeq()
+        self.last_frame_seq = seq
+        self.frame_cache.bind(src, seq)
+        return src
+
     def getCameraImage(self, crop_fmt: int | str = "", crop: List[int] = []) -> ImageProcessing.image_type:
         """
         カメラから画像データを取得する
@@ -480,7 +578,7 @@ class ImageProcPythonCommand(PythonCommand):
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
         # カメラの画像を取得
-        src = self.camera.readFrame()
+        src = self.readFrame()
 
         # トリミング
         cropped_image = crop_image(src, crop=crop_cv2)
@@ -494,6 +592,87 @@ class ImageProcPythonCommand(PythonCommand):
         image = getImage(self.get_filespec(filename, mode=mode), mode="color")
         return image
 
+    def getTemplateImage(
+        self,
+        template_path: str | ImageProcessing.image_type,
+        use_gray: bool = True,
+        crop_template: List[int] = [],
+        BGR_range: Optional[dict] = None,
+        threshold_binary: Optional[int] = None,
+    ) -> Tuple[ImageProcessing.image_type, int, int]:
+        """
+        前処理済みのテンプレート画像とそのサイズを取得する
+        パスで指定された場合はキャッシュを使用する(crop_templateはopencv形式)
+        """
+        if isinstance(template_path, ImageProcessing.image_type):
+            return doPreprocessImage(
+                template_path,
+                use_gray=use_gray,
+                crop=crop_template,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+            )
+        return self.template_cache.getTemplate(
+            self.get_filespec(template_path, mode="t"),
+            use_gray=use_gray,
+            crop=crop_template,
+            BGR_range=BGR_range,
+            threshold_binary=threshold_binary,
+        )
+
+    def getImageProcessing(self, use_gpu: bool = False) -> ImageProcessing:
+        """
+        画像認識に使用するImageProcessingを取得する(呼び出しごとに作成せず再利用する)
+        """
+        if not use_gpu:
+            return self.ImgProc
+        if self.ImgProcGPU is None:
+            self.ImgProcGPU = ImageProcessing(use_gpu=True)
+        return self.ImgProcGPU
+
+    def getLastLocationWindow(
+        self,
+        src: ImageProcessing.image_type,
+        last_loc: Tuple[int, int],
+        template_image: ImageProcessing.image_type,
+        crop_cv2: List[int] = [],
+    ) -> Optional[List[int]]:
+        """
+        前回の検出位置の周辺の探索範囲を取得する(opencv形式)
+        cropで指定した範囲の外側は含めない。テンプレート画像が収まらない場合はNoneを返す
+        """
+        height, width = template_image.shape[0], template_image.shape[1]
+        if crop_cv2:
+            y_min, y_max, x_min, x_max = crop_cv2
+        else:
+            y_min, y_max, x_min, x_max = 0, src.shape[0], 0, src.shape[1]
+        margin = self.last_location_margin
+        y_start = max(last_loc[1] - margin, y_min, 0)
+        y_end = min(last_loc[1] + height + margin, y_max, src.shape[0])
+        x_start = max(last_loc[0] - margin, x_min, 0)
+        x_end = min(last_loc[0] + width + margin, x_max, src.shape[1])
+        if y_end - y_start < height or x_end - x_start < width:
+            return None
+        return [y_start, y_end, x_start, x_end]
+
+    def getLastLocationStats(self) -> dict:
+        """
+        テンプレート画像ごとに、前回の検出位置の周辺で見つかった回数(hit)と見つからなかった回数(miss)を返す
+        """
+        return {
+            key: dict(stats, hit_rate=stats["hit"] / max(stats["hit"] + stats["miss"], 1))
+            for key, stats in self.last_location_stats.items()
+        }
+
+    def getMaskImage(self, mask_path: str | ImageProcessing.image_type) -> Optional[ImageProcessing.image_type]:
+        """
+        マスク画像を取得する
+        パスで指定された場合はキャッシュを使用する
+        """
+        if mask_path is None or isinstance(mask_path, ImageProcessing.image_type):
+            return mask_path
+        return self.template_cache.getImage(self.get_filespec(mask_path, mode="t"), mode="binary")
+
     @pausedecorator2
     def isContainTemplate(
         self,
@@ -513,10 +692,24 @@ class ImageProcPythonCommand(PythonCommand):
         crop_template: List[int] = [],
         show_image: bool = False,
         color: List[str] = ["blue", "red", "orange"],
+        wait_new_frame: bool = False,
+        pyramid_levels: int = 0,
+        early_exit: bool = False,
+        use_last_location: bool = False,
     ) -> bool:
         """
         現在のスクリーンショットと指定した画像のテンプレートマッチングを行います。
         色の違いを考慮しないのであればパフォーマンスの点からuse_grayをTrueにしてグレースケール画像を使うことを推奨します。
+        wait_new_frameをTrueにすると前回使用したフレームより新しいフレームが届くまで待ってから判定します。
+        (ループ内で同じフレームを何度も判定することを防げます。)
+        pyramid_levelsを1以上にすると、1/2**pyramid_levelsに縮小した画像で大まかな位置を探索してから
+        その周辺のみ元の解像度で探索します。(広い範囲を探索する場合に高速になります。)
+        閾値を超えなかった場合は画像全体を元の解像度で探索し直すため、判定結果が変わることはありません。
+        early_exitをTrueにすると、前回の検出位置に近い範囲から順に探索し、閾値を超えた時点で探索を打ち切ります。
+        (判定結果のみが必要な場合に高速になります。表示される類似度は画像全体の最大値とは限りません。)
+        use_last_locationをTrueにすると、前回の検出位置の周辺(last_location_margin)を先に探索し、
+        見つからなかった場合のみcropで指定した範囲全体を探索します。(同じ位置に表示される画像の判定が高速になります。)
+        前回の検出位置の周辺で見つかった回数はgetLastLocationStatsで確認できます。
         """
 
         # crop_fmtに応じてcropの中身を並び替える
@@ -524,36 +717,71 @@ class ImageProcPythonCommand(PythonCommand):
         crop_template_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop_template)
 
         # カメラの画像を取得
-        src = self.camera.readFrame()
+        src = self.readFrame(wait_new_frame=wait_new_frame)
 
-        # テンプレート画像を取得
-        if isinstance(template_path, ImageProcessing.image_type):
-            template_image = template_path
-        else:
-            template_image = getImage(self.get_filespec(template_path, mode="t"), mode="color")
+        # テンプレート画像を取得(前処理済み)
+        template_image, _, _ = self.getTemplateImage(
+            template_path,
+            use_gray=use_gray,
+            crop_template=crop_template_cv2,
+            BGR_range=BGR_range,
+            threshold_binary=threshold_binary,
+        )
 
         # マスク画像を取得
-        if isinstance(mask_path, ImageProcessing.image_type):
-            mask_image = mask_path
-        else:
-            mask_image = (
-                getImage(self.get_filespec(mask_path, mode="t"), mode="binary") if mask_path is not None else None
-            )
+        mask_image = self.getMaskImage(mask_path)
 
-        # テンプレートマッチング
-        res, max_loc, width, height, max_val = ImageProcessing(use_gpu=use_gpu).isContainTemplate(
-            src,
-            template_image,
+        # 探索範囲の左上の位置(トリミング前の画像上の座標)
+        offset = (crop_pillow[0], crop_pillow[1]) if crop_pillow else (0, 0)
+
+        # 前回の検出位置(パスで指定されたテンプレート画像のみ)
+        match_key = (template_path, tuple(crop_cv2)) if isinstance(template_path, str) else None
+        last_loc = self.last_match_loc.get(match_key)
+
+        match_kwargs = dict(
             mask_image=mask_image,
             threshold=threshold,
             use_gray=use_gray,
-            crop=crop_cv2,
             BGR_range=BGR_range,
             threshold_binary=threshold_binary,
             crop_template=crop_template_cv2,
             show_image=show_image,
+            is_template_preprocessed=True,
+            frame_cache=self.frame_cache,
         )
 
+        # 前回の検出位置の周辺を探索する
+        res = False
+        window_cv2 = None
+        if use_last_location and last_loc is not None:
+            window_cv2 = self.getLastLocationWindow(src, last_loc, template_image, crop_cv2)
+        if window_cv2 is not None:
+            res, max_loc, width, height, max_val = self.getImageProcessing(use_gpu).isContainTemplate(
+                src, template_image, crop=window_cv2, **match_kwargs
+            )
+            stats = self.last_location_stats.setdefault(match_key, {"hit": 0, "miss": 0})
+            stats["hit" if res else "miss"] += 1
+            if res:
+                # cropで指定した範囲上の座標に変換する
+                max_loc = (max_loc[0] + window_cv2[2] - offset[0], max_loc[1] + window_cv2[0] - offset[1])
+
+        # テンプレートマッチング
+        if not res:
+            search_hint = None
+            if early_exit and last_loc is not None:
+                search_hint = (last_loc[0] - offset[0], last_loc[1] - offset[1])
+            res, max_loc, width, height, max_val = self.getImageProcessing(use_gpu).isContainTemplate(
+                src,
+                template_image,
+                crop=crop_cv2,
+                pyramid_levels=pyramid_levels,
+                early_exit=early_exit,
+                search_hint=search_hint,
+                **match_kwargs,
+            )
+        if res and match_key is not None:
+            self.last_match_loc[match_key] = (max_loc[0] + offset[0], max_loc[1] + offset[1])
+
         # テンプレートマッチングの結果(類似度)を表示する
         if show_value or self.isSimilarity:
             tm_mode = "NCC" if mask_path is not None else "ZNCC"
@@ -593,6 +821,8 @@ class ImageProcPythonCommand(PythonCommand):
         crop_template: List[int] = [],
         show_image: bool = False,
         color: List[str] = ["blue", "red", "orange"],
+        wait_new_frame: bool = False,
+        pyramid_levels: int = 0,
     ) -> Tuple(int, List[float], List[bool]):  # type: ignore
         """
         # 現在のスクリーンショットと指定した複数の画像のテンプレートマッチングを行います。
@@ -605,29 +835,28 @@ class ImageProcPythonCommand(PythonCommand):
         crop_template_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop_template)
 
         # カメラの画像を取得
-        src = self.camera.readFrame()
+        src = self.readFrame(wait_new_frame=wait_new_frame)
 
-        # テンプレート画像を取得
+        # テンプレート画像を取得(前処理済み)
         template_image_list = []
         for i in template_path_list:
-            if isinstance(i, ImageProcessing.image_type):
-                template_image_list.append(i)
-            else:
-                template_image_list.append(getImage(self.get_filespec(i, mode="t"), mode="color"))
+            template_image, _, _ = self.getTemplateImage(
+                i,
+                use_gray=use_gray,
+                crop_template=crop_template_cv2,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+            )
+            template_image_list.append(template_image)
 
         # マスク画像を取得
         mask_image_list = []
         if mask_path_list is not None:
             for i in mask_path_list:
-                if isinstance(i, ImageProcessing.image_type):
-                    mask_image_list.append(i)
-                else:
-                    mask_image_list.append(getImage(self.get_filespec(i, mode="t"), mode="binary"))
+                mask_image_list.append(self.getMaskImage(i))
 
         # テンプレートマッチング
-        max_idx, max_val_list, max_loc_list, width_list, height_list, judge_list = ImageProcessing(
-            use_gpu=False
-        ).isContainTemplate_max(
+        max_idx, max_val_list, max_loc_list, width_list, height_list, judge_list = self.ImgProc.isContainTemplate_max(
             src,
             template_image_list,
             mask_image_list=mask_image_list,
@@ -638,6 +867,9 @@ class ImageProcPythonCommand(PythonCommand):
             threshold_binary=threshold_binary,
             crop_template=crop_template_cv2,
             show_image=show_image,
+            is_template_preprocessed=True,
+            frame_cache=self.frame_cache,
+            pyramid_levels=pyramid_levels,
         )
 
         # テンプレートマッチングの結果(類似度)を表示する
@@ -678,6 +910,104 @@ class ImageProcPythonCommand(PythonCommand):
 
         return max_idx, max_val_list, judge_list
 
+    @pausedecorator2
+    def isContainTemplate_batch(
+        self,
+        template_list: List[dict],
+        use_gray: bool = True,
+        show_value: bool = False,
+        show_position: bool = True,
+        show_only_true_rect: bool = True,
+        ms: float = 2000,
+        crop_fmt: int | str = "",
+        BGR_range: Optional[dict] = None,
+        threshold_binary: Optional[int] = None,
+        color: List[str] = ["blue", "red", "orange"],
+        wait_new_frame: bool = False,
+    ) -> ImageProcessing.image_type:
+        """
+        現在のスクリーンショットに対して、複数のテンプレート画像のテンプレートマッチングをまとめて行います。
+        template_listの各要素は以下のキーを持つdictです。(template_path以外は省略可能)
+            template_path, threshold, crop, crop_template, mask_path, use_gray, BGR_range, threshold_binary
+        use_gray/BGR_range/threshold_binaryを省略した要素には引数の値を使用します。
+        各テンプレートの類似度、位置、閾値判定結果を持つ配列(template_listと同じ順番)を返します。
+        例) res = self.isContainTemplate_batch([{"template_path": "A.png", "crop": [0, 0, 640, 360]}])
+            res["judge"][0] -> 閾値判定結果, res["max_val"][0] -> 類似度
+        """
+
+        # カメラの画像を取得
+        src = self.readFrame(wait_new_frame=wait_new_frame)
+
+        request_list = []
+        crop_pillow_list = []
+        for template in template_list:
+            # crop_fmtに応じてcropの中身を並び替える
+            crop_cv2, crop_pillow = convertCv2Format(crop_fmt=crop_fmt, crop=template.get("crop", []))
+            crop_template_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=template.get("crop_template", []))
+            crop_pillow_list.append(crop_pillow)
+
+            # テンプレート画像を取得(前処理済み)
+            _use_gray = template.get("use_gray", use_gray)
+            _BGR_range = template.get("BGR_range", BGR_range)
+            _threshold_binary = template.get("threshold_binary", threshold_binary)
+            template_image, _, _ = self.getTemplateImage(
+                template["template_path"],
+                use_gray=_use_gray,
+                crop_template=crop_template_cv2,
+                BGR_range=_BGR_range,
+                threshold_binary=_threshold_binary,
+            )
+            request_list.append(
+                {
+                    "template": template_image,
+                    "mask": self.getMaskImage(template.get("mask_path")),
+                    "threshold": template.get("threshold", 0.7),
+                    "crop": crop_cv2,
+                    "use_gray": _use_gray,
+                    "BGR_range": _BGR_range,
+                    "threshold_binary": _threshold_binary,
+                }
+            )
+
+        # テンプレートマッチング
+        result = self.ImgProc.isContainTemplate_batch(
+            src, request_list, is_template_preprocessed=True, frame_cache=self.frame_cache
+        )
+
+        # テンプレートマッチングの結果(類似度)を表示する
+        if show_value or self.isSimilarity:
+            for template, request, res in zip(template_list, request_list, result):
+                tm_mode = "NCC" if request["mask"] is not None else "ZNCC"
+                print(f"{template['template_path']} {tm_mode} value: {res['max_val']}")
+
+        # canvasに検出位置を表示
+        if show_position:
+            for res, crop_pillow in zip(result, crop_pillow_list):
+                tag = str(time.perf_counter()) + str(random.random())
+                loc = (int(res["x"]), int(res["y"]))
+                if res["judge"]:
+                    self.displayRectangle(
+                        loc,
+                        int(res["width"]),
+                        int(res["height"]),
+                        tag,
+                        ms,
+                        color=[color[0], color[2]],
+                        crop=crop_pillow,
+                    )
+                elif not show_only_true_rect:
+                    self.displayRectangle(
+                        loc,
+                        int(res["width"]),
+                        int(res["height"]),
+                        tag,
+                        ms,
+                        color=[color[1], color[2]],
+                        crop=crop_pillow,
+                    )
+
+        return result
+
     @pausedecorator2
     def isContainTemplateGPU(
         self,
@@ -754,24 +1084,19 @@ class ImageProcPythonCommand(PythonCommand):
         crop_template_cv2, crop_template_pillow = convertCv2Format(crop_fmt=crop_fmt, crop=crop_template)
 
         # カメラの画像を取得
-        template_image = self.camera.readFrame()
+        template_image = self.readFrame()
 
         # テンプレートマッチング対象画像を取得
         if isinstance(image_path, ImageProcessing.image_type):
             image = image_path
         else:
-            image = getImage(self.get_filespec(image_path, mode="t"), mode="color")
+            image = self.template_cache.getImage(self.get_filespec(image_path, mode="t"), mode="color")
 
         # マスク画像を取得
-        if isinstance(mask_path, ImageProcessing.image_type):
-            mask_image = mask_path
-        else:
-            mask_image = (
-                getImage(self.get_filespec(mask_path, mode="t"), mode="binary") if mask_path is not None else None
-            )
+        mask_image = self.getMaskImage(mask_path)
 
         # テンプレートマッチング
-        res, _, width, height, max_val = ImageProcessing(use_gpu=use_gpu).isContainTemplate(
+        res, _, width, height, max_val = self.getImageProcessing(use_gpu).isContainTemplate(
             image,
             template_image,
             mask_image=mask_image,
@@ -875,7 +1200,7 @@ class ImageProcPythonCommand(PythonCommand):
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
         # カメラの画像を取得
-        src = self.camera.readFrame()
+        src = self.readFrame()
 
         # ファイル名を設定する
         if filename is None or filename == "":
@@ -889,7 +1214,7 @@ class ImageProcPythonCommand(PythonCommand):
             save_path = self.get_filespec(filename, mode="n")
 
         # 画像を保存する
-        ImageProcessing().saveImage(src, filename=save_path, crop=crop_cv2)
+        self.ImgProc.saveImage(src, filename=save_path, crop=crop_cv2)
 
     def popupImage(self, crop_fmt: int | str = "", crop: List[int] = [], title: str = "image"):
         """
@@ -899,7 +1224,7 @@ class ImageProcPythonCommand(PythonCommand):
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
         # カメラの画像を取得
-        src = self.camera.readFrame()
+        src = self.readFrame()
 
         opneImage(src, crop=crop_cv2, title=title)
 
@@ -911,7 +1236,7 @@ class ImageProcPythonCommand(PythonCommand):
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
         # カメラの画像を取得
-        src = self.camera.readFrame()
+        src = self.readFrame()
 
         # トリミング
         cropped_image = crop_image(src, crop=crop_cv2)
@@ -937,7 +1262,7 @@ class ImageProcPythonCommand(PythonCommand):
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
         # カメラの画像を取得
-        src = self.camera.readFrame()
+        src = self.readFrame()
 
         # トリミング
         cropped_image = crop_image(src, crop=crop_cv2)
@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from typing import List, TYPE_CHECKING
+from typing import List, Optional, TYPE_CHECKING
 
+import bisect
+import json
 import math
 import os
+import threading
 import time
 import platform
+from collections import Counter, deque
 
 import serial
 from logging import getLogger, DEBUG, NullHandler
@@ -14,11 +18,129 @@ from logging import getLogger, DEBUG, NullHandler
 if TYPE_CHECKING:
     import tkinter as tk
 
+    from VirtualDevices import LoopbackSerial
+
+
+class SenderMetrics:
+    """
+    シリアル通信の送信の計測値
+    書き込みにかかった時間・入力の間隔のヒストグラム、送信量(byte/s, packet/s)、エラーの種類ごとの回数を記録する。
+    getMetricsで取得(GUIなどから定期的に取得する)するか、dumpでJSONファイルに保存する。
+    """
+
+    write_time_buckets_ms = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)  # 書き込み時間のヒストグラムの区間(ms)
+    gap_buckets_ms = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # 入力の間隔のヒストグラムの区間(ms)
+    rate_window = 1.0  # 直近の送信量を計算する期間(s)
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        計測値をリセットする
+        """
+        with self.__lock:
+            self.start_time = time.perf_counter()
+            self.packets = 0
+            self.bytes = 0
+            self.write_time_counts = [0] * (len(self.write_time_buckets_ms) + 1)
+            self.write_time_sum = 0.0
+            self.write_time_max = 0.0
+            self.gap_counts = [0] * (len(self.gap_buckets_ms) + 1)
+            self.last_submit = None
+            self.errors = Counter()
+            self.__recent = deque()  # 直近の(書き込み完了時刻, byte数)
+
+    def recordSubmit(self, now: float):
+        """
+        送信するパケットが渡された時刻を記録する(前回からの間隔を入力の間隔とする)
+        """
+        with self.__lock:
+            if self.last_submit is not None:
+                self.gap_counts[bisect.bisect_left(self.gap_buckets_ms, (now - self.last_submit) * 1000)] += 1
+            self.last_submit = now
+
+    def recordWrite(self, size: int, started: float, completed: float):
+        """
+        書き込みが完了したパケットのbyte数と書き込みの開始・完了時刻を記録する
+        """
+        elapsed = completed - started
+        with self.__lock:
+            self.packets += 1
+            self.bytes += size
+            self.write_time_counts[bisect.bisect_left(self.write_time_buckets_ms, elapsed * 1000)] += 1
+            self.write_time_sum += elapsed
+            self.write_time_max = max(self.write_time_max, elapsed)
+            self.__recent.append((completed, size))
+            while self.__recent[0][0] < completed - self.rate_window:
+                self.__recent.popleft()
+
+    def recordError(self, error: Exception):
+        """
+        書き込みのエラーを種類(例外のクラス名)ごとに記録する
+        """
+        with self.__lock:
+            self.errors[type(error).__name__] += 1
+
+    @staticmethod
+    def _histogram(buckets: tuple, counts: list) -> dict:
+        labels = [f"<={bound}" for bound in buckets] + [f">{buckets[-1]}"]
+        return dict(zip(labels, counts))
+
+    def getMetrics(self) -> dict:
+        """
+        計測値を返す(時間の単位はms)
+        """
+        now = time.perf_counter()
+        with self.__lock:
+            elapsed = now - self.start_time
+            while self.__recent and self.__recent[0][0] < now - self.rate_window:
+                self.__recent.popleft()
+            recent_bytes = sum(size for _, size in self.__recent)
+            return {
+                "elapsed_s": elapsed,
+                "packets": self.packets,
+                "bytes": self.bytes,
+                "packets_per_s": self.packets / elapsed if elapsed > 0 else 0.0,
+                "bytes_per_s": self.bytes / elapsed if elapsed > 0 else 0.0,
+                "recent_packets_per_s": len(self.__recent) / self.rate_window,
+                "recent_bytes_per_s": recent_bytes / self.rate_window,
+                "mean_write_ms": self.write_time_sum / self.packets * 1000 if self.packets else 0.0,
+                "max_write_ms": self.write_time_max * 1000,
+                "write_ms_histogram": self._histogram(self.write_time_buckets_ms, self.write_time_counts),
+                "input_gap_ms_histogram": self._histogram(self.gap_buckets_ms, self.gap_counts),
+                "errors": dict(self.errors),
+            }
+
+    def dump(self, filename: str, extra: dict = None):
+        """
+        計測値をJSONファイルに保存する
+        """
+        metrics = self.getMetrics()
+        if extra:
+            metrics.update(extra)
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2)
+
 
 class Sender:
-    def __init__(self, is_show_serial: tk.BooleanVar, if_print: bool = True):
+    write_queue_size = 64  # 送信スレッドで送信待ちにできるパケット数(超えた場合は空きができるまで待つ)
+
+    def __init__(
+        self,
+        is_show_serial: tk.BooleanVar | bool,
+        if_print: bool = True,
+        use_writer: bool = False,
+        coalesce: bool = False,
+    ):
         self.ser = None
         self.is_show_serial = is_show_serial
+        # 送信のたびにtkの変数を読み込まないように、表示設定はtkの変数が変更されたときに更新する
+        # (GUIを使用しない場合はboolを指定する)
+        self.show_serial = bool(is_show_serial.get() if hasattr(is_show_serial, "get") else is_show_serial)
+        if hasattr(is_show_serial, "trace_add"):
+            is_show_serial.trace_add("write", self.__updateShowSerial)
 
         self._logger = getLogger(__name__)
         self._logger.addHandler(NullHandler())
@@ -53,7 +175,31 @@ class Sender:
         ]
         self.Hat = ["TOP", "TOP_RIGHT", "RIGHT", "BTM_RIGHT", "BTM", "BTM_LEFT", "LEFT", "TOP_LEFT", "CENTER"]
 
+        # 送信スレッド(writer)の設定
+        # 起動後はスレッドがシリアルポートを占有し、各write関数はパケットを送信待ちの列に追加してすぐに戻る。
+        # coalesce=Trueの場合、送信待ちのパケットは新しいパケットで置き換える(各パケットが入力の状態全体を表すため、
+        # 送信が遅れた場合でも最新の状態のみを送信する。短い入力は送信されずに置き換えられる場合がある)。
+        self.use_writer = use_writer
+        self.coalesce = coalesce
+        self._writer_thread = None
+        self._writer_stop = threading.Event()
+        self._write_queue = deque()
+        self._write_cond = threading.Condition()
+        self._write_pending = 0  # 送信待ちおよび送信中のパケット数
+        self.last_write_time = None  # 最後に送信が完了した時刻(time.perf_counter基準)
+        self.resetWriterStats()
+        self.metrics = SenderMetrics()
+
+    def __updateShowSerial(self, *args):
+        self.show_serial = bool(self.is_show_serial.get())
+
     def openSerial(self, portNum: int, portName: str = "", baudrate: int = 9600):
+        opened = self._openSerialPort(portNum, portName, baudrate)
+        if opened and self.use_writer:
+            self.startWriter()
+        return opened
+
+    def _openSerialPort(self, portNum: int, portName: str = "", baudrate: int = 9600):
         try:
             if portName is None or portName == "":
                 if os.name == "nt":
@@ -89,14 +235,205 @@ class Sender:
             # print(e)
             return False
 
+    def openVirtualSerial(self, port: Optional[LoopbackSerial] = None):
+        """
+        仮想シリアルポートを開く(マイコンを使用しない動作確認用)
+        送信データはportに記録される(省略した場合はLoopbackSerialを作成する)
+        """
+        if port is None:
+            # VirtualDevicesはcv2を読み込むため、仮想シリアルポートを使用する場合のみimportする
+            from VirtualDevices import LoopbackSerial
+
+            port = LoopbackSerial()
+        self.ser = port
+        print("connecting to virtual serial port " + self.ser.port)
+        self._logger.info("connecting to virtual serial port " + self.ser.port)
+        if self.use_writer:
+            self.startWriter()
+        return True
+
     def closeSerial(self):
         self._logger.debug("Closing the serial communication")
+        if not self.stopWriter():
+            # 書き込み中のポートを閉じないようにする(送信スレッドが終了した後に再度閉じる)
+            self._logger.error("Serial port is not closed: the serial writer is still writing.")
+            return
         self.ser.close()
 
     def isOpened(self):
         self._logger.debug("Checking if serial communication is open")
         return True if self.ser is not None and self.ser.isOpen() else False
 
+    def startWriter(self):
+        """
+        送信スレッドを起動する。
+        起動後は送信スレッドのみがシリアルポートに書き込み、コマンド側はUSBの遅延で待たされない。
+        """
+        if not self.isOpened():
+            self._logger.warning("Serial writer cannot start: serial port is not opened.")
+            return
+
+        with self._write_cond:
+            # 停止中(書き込みが終わっていない)のスレッドがある場合はそのスレッドを引き続き使用する
+            self._writer_stop.clear()
+            if self._writer_thread is not None:
+                return
+            self._writer_thread = threading.Thread(
+                target=self._writePackets, args=(self.ser,), name="SerialWriter", daemon=True
+            )
+            self._writer_thread.start()
+        self._logger.debug("Serial writer started")
+
+    def stopWriter(self, timeout: float = 1.0) -> bool:
+        """
+        送信スレッドを停止する(送信待ちのパケットを送信してから停止する)。
+        timeout秒以内に停止しなかった場合(書き込みが戻らない場合)はFalseを返す。
+        その場合もスレッドは書き込みが戻った後に終了し、それまでのパケットは送信待ちの列に追加される。
+        """
+        with self._write_cond:
+            thread = self._writer_thread
+            if thread is None:
+                return True
+            self._writer_stop.set()
+            self._write_cond.notify_all()
+        thread.join(timeout=timeout)
+        if thread.is_alive():
+            self._logger.warning("Serial writer did not stop within the timeout.")
+            return False
+        self._logger.debug("Serial writer stopped")
+        return True
+
+    def isWriterRunning(self) -> bool:
+        return self._writer_thread is not None and self._writer_thread.is_alive()
+
+    def waitWritten(self, timeout: float = None) -> bool:
+        """
+        送信待ちのパケットがすべて送信されるまで待機する。
+        タイムアウトした場合はFalseを返す。
+        """
+        if not self.isWriterRunning():
+            return True
+        with self._write_cond:
+            return self._write_cond.wait_for(lambda: self._write_pending == 0, timeout=timeout)
+
+    def _write(self, data: bytes):
+        """
+        パケットを送信する(送信スレッドの起動中は送信待ちの列に追加する)。
+        """
+        queued_at = time.perf_counter()
+        self.metrics.recordSubmit(queued_at)
+        with self._write_cond:
+            # 送信スレッドは終了するときに同じロックの中で_writer_threadをNoneにするため、
+            # 送信スレッドが残っている間は必ず送信待ちの列に追加され、2つのスレッドが同時に書き込むことはない
+            if self._writer_thread is not None:
+                if self.coalesce and self._write_queue:
+                    # 送信されていない古い状態は送信せずに新しい状態で置き換える
+                    self._write_queue[-1] = (data, self._write_queue[-1][1])
+                    self.coalesced_count += 1
+                    return
+                while len(self._write_queue) >= self.write_queue_size and self._writer_thread is not None:
+                    self._write_cond.wait(0.1)
+                if self._writer_thread is not None:
+                    self._write_queue.append((data, queued_at))
+                    self._write_pending += 1
+                    self.queued_count += 1
+                    self.max_queue_depth = max(self.max_queue_depth, len(self._write_queue))
+                    self._write_cond.notify_all()
+                    return
+
+        try:
+            self.ser.write(data)
+        except Exception as e:
+            self.metrics.recordError(e)
+            raise
+        self.last_write_time = time.perf_counter()
+        self.metrics.recordWrite(len(data), queued_at, self.last_write_time)
+
+    def _writePackets(self, ser):
+        """
+        送信スレッドの本体。
+        送信待ちのパケットを順番に送信し、送信が完了した時刻を記録する。
+        """
+        while True:
+            with self._write_cond:
+                while not self._write_queue and not self._writer_stop.is_set():
+                    self._write_cond.wait()
+                if not self._write_queue:
+                    # 停止する(以降のパケットは各write関数が直接送信する)
+                    if self._writer_thread is threading.current_thread():
+                        self._writer_thread = None
+                    self._write_cond.notify_all()
+                    break
+                data, queued_at = self._write_queue.popleft()
+                self._write_cond.notify_all()
+            started = time.perf_counter()
+            try:
+                ser.write(data)
+            except serial.serialutil.SerialException as e:
+                self._logger.error(f"Error : {e}")
+                self.write_errors += 1
+                self.metrics.recordError(e)
+            except Exception as e:
+                self._logger.error(f"Serial writer error : {e}")
+                self.write_errors += 1
+                self.metrics.recordError(e)
+            else:
+                self.metrics.recordWrite(len(data), started, time.perf_counter())
+            completed = time.perf_counter()
+            with self._write_cond:
+                self.last_write_time = completed
+                self.written_count += 1
+                latency = completed - queued_at
+                self.__latency_sum += latency
+                self.max_latency = max(self.max_latency, latency)
+                self._write_pending -= 1
+                self._write_cond.notify_all()
+
+    def resetWriterStats(self):
+        """
+        送信スレッドの統計をリセットする
+        """
+        with self._write_cond:
+            self.queued_count = 0
+            self.written_count = 0
+            self.coalesced_count = 0
+            self.write_errors = 0
+            self.max_queue_depth = 0
+            self.max_latency = 0.0
+            self.__latency_sum = 0.0
+
+    def getWriterStats(self) -> dict:
+        """
+        送信スレッドの統計
+        送信待ちの列に追加してから送信が完了するまでの時間(latency)の平均・最大(ms)などを返す
+        """
+        with self._write_cond:
+            return {
+                "running": self.isWriterRunning(),
+                "queued": self.queued_count,
+                "written": self.written_count,
+                "coalesced": self.coalesced_count,
+                "errors": self.write_errors,
+                "pending": self._write_pending,
+                "max_queue_depth": self.max_queue_depth,
+                "mean_latency_ms": self.__latency_sum / self.written_count * 1000 if self.written_count else 0.0,
+                "max_latency_ms": self.max_latency * 1000,
+            }
+
+    def getMetrics(self) -> dict:
+        """
+        送信の計測値(SenderMetrics.getMetrics)と送信スレッドの統計(getWriterStats)
+        """
+        metrics = self.metrics.getMetrics()
+        metrics["writer"] = self.getWriterStats()
+        return metrics
+
+    def dumpMetrics(self, filename: str):
+        """
+        送信の計測値をJSONファイルに保存する
+        """
+        self.metrics.dump(filename, extra={"writer": self.getWriterStats()})
+
     def writeRow(self, row: str, is_show: bool = False):
         try:
             self.time_bef = time.perf_counter()
@@ -104,7 +441,7 @@ class Sender:
                 output = self.before.split(" ")
                 self.show_input(output)
 
-            self.ser.write((row + "\r\n").encode("utf-8"))
+            self._write((row + "\r\n").encode("utf-8"))
             self.time_aft = time.perf_counter()
             self.before = row
         except serial.serialutil.SerialException as e:
@@ -116,7 +453,7 @@ class Sender:
             self._logger.error(e)
         # self._logger.debug(f"{row}")
         # Show sending serial datas
-        if self.is_show_serial.get():
+        if self.show_serial:
             print(row)
 
     def writeList(self, values: list, is_show: bool = False):
@@ -125,7 +462,7 @@ class Sender:
             if self.before is not None and self.before != "end" and is_show:
                 pass
 
-            self.ser.write(values)
+            self._write(bytes(values))
             self.time_aft = time.perf_counter()
             self.before = values
         except serial.serialutil.SerialException as e:
@@ -137,12 +474,25 @@ class Sender:
             self._logger.error(e)
         # self._logger.debug(f"{values}")
         # Show sending serial datas
-        if self.is_show_serial.get():
+        if self.show_serial:
             print(values)
 
+    def writeBytes(self, data: bytes):
+        """
+        エンコード済みのデータをそのまま送信する(Macroの再生用)
+        """
+        try:
+            self._write(data)
+        except serial.serialutil.SerialException as e:
+            self._logger.error(f"Error : {e}")
+        except AttributeError as e:
+            print("Using a port that is not open.")
+            self._logger.error("Maybe Using a port that is not open.")
+            self._logger.error(e)
+
     def writeRow_wo_perf_counter(self, row: str, is_show: bool = False):
         try:
-            self.ser.write((row + "\r\n").encode("utf-8"))
+            self._write((row + "\r\n").encode("utf-8"))
         except serial.serialutil.SerialException as e:
             # エラーはあえてprintでも出す。
             print(e)
@@ -153,7 +503,7 @@ class Sender:
             self._logger.error(e)
         # self._logger.debug(f"{row}")
         # Show sending serial datas
-        if self.is_show_serial.get():
+        if self.show_serial:
             print(row)
 
     def show_input(self, output: List[str]):
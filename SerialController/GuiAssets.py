@@ -23,6 +23,7 @@ from Commands.Keys import Direction, Stick, Touchscreen, NEUTRAL, KeyPress
 import logging
 from logging import StreamHandler, getLogger, DEBUG, NullHandler
 from Commands.PythonCommandBase import PythonCommand
+from PreviewRenderer import PreviewRenderer
 
 try:
     os.makedirs("log")
@@ -58,6 +59,11 @@ class MouseStick(PythonCommand):
 
 
 class CaptureArea(tk.Canvas):
+    # ウィンドウにフォーカスがない場合・最小化されている場合のプレビューのfps
+    unfocused_fps = 10
+    # プレビューを表示しない場合に表示の再開を確認する間隔(ms)
+    hidden_poll_ms = 100
+
     def __init__(
         self, camera, fps, right_mouse_mode, is_show, ser: KeyPress, master=None, show_width=640, show_height=360
     ):
@@ -147,6 +153,11 @@ class CaptureArea(tk.Canvas):
         # self.configure(image=self.disabled_tk)  # labelからキャンバスに変更したので微修正
         self.im_ = self.create_image(0, 0, image=self.disabled_tk, anchor=tk.NW)
 
+        # プレビューの画像は別スレッドで作成し、表示用のPhotoImageは1つを使い回す(pasteで更新する)
+        self.renderer = PreviewRenderer(self.camera)
+        self.preview_tk = None
+        self.preview_fps = 0
+
     def ApplyLStickMouse(self):
         if self.master.is_use_left_stick_mouse.get():
             self.BindLeftClick()
@@ -348,10 +359,25 @@ class CaptureArea(tk.Canvas):
             self.BindRightClick()
 
     def setFps(self, fps):
+        # プレビューの最大のfps(ウィンドウにフォーカスがある場合)。カメラからのフレームの取得には影響しない
+        self.fps = int(fps)
         # self.next_frames = int(16 * (60 / int(fps)))
         self.next_frames = int(1000 / int(fps))
         self._logger.info(f"FPS set to {fps}")
 
+    def getPreviewFps(self) -> int:
+        """
+        現在のプレビューの表示間隔(fps)
+        表示しない場合は0、ウィンドウにフォーカスがない場合・最小化されている場合はunfocused_fps、それ以外はsetFpsの値
+        """
+        if not self.is_show_var.get():
+            return 0
+        # focus_displayofはコンボボックスのドロップダウンにフォーカスがあるとKeyErrorになるため、Tclで直接確認する
+        has_focus = bool(str(self.tk.call("focus", "-displayof", self._w)))
+        if not has_focus or not self.winfo_viewable():
+            return min(self.fps, self.unfocused_fps)
+        return self.fps
+
     def setShowsize(self, show_height, show_width):
         self.show_width = int(show_width)
         self.show_height = int(show_height)
@@ -634,29 +660,54 @@ class CaptureArea(tk.Canvas):
                     self.RSTICK_logger.debug(",".join(list(map(str, _))))
 
     def startCapture(self):
+        self.renderer.start()
         self.capture()
 
+    def stopCapture(self):
+        self.renderer.stop()
+        self._logger.debug(f"Preview stats: {self.getPreviewStats()}")
+
+    def getPreviewStats(self) -> dict:
+        """
+        プレビューの表示したフレーム数・飛ばしたフレーム数などの統計(PreviewRenderer.getStats)
+        """
+        stats = self.renderer.getStats()
+        stats["preview_fps"] = self.preview_fps
+        return stats
+
     def capture(self):
-        if self.is_show_var.get():
-            image_bgr = self.camera.readFrame()
-        else:
-            self.after(self.next_frames, self.capture)
+        fps = self.getPreviewFps()
+        if fps != self.preview_fps:
+            self._logger.debug(f"Preview FPS changed to {fps}")
+            self.preview_fps = fps
+        if fps <= 0:
+            self.after(self.hidden_poll_ms, self.capture)
             return
 
-        if image_bgr is not None:
-            image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-            image_pil = Image.fromarray(image_rgb).resize(self.show_size)
-            image_tk = ImageTk.PhotoImage(image_pil)
+        # 作成済みの画像があれば表示し、次の画像の作成を要求する(作成が間に合わない場合は今回は表示しない)
+        ready, image_pil = self.renderer.takeImage()
+        if ready:
+            self.showImage(image_pil)
+        self.renderer.request(self.show_size)
 
-            self.im = image_tk
-            # self.configure( image=image_tk)
-            self.itemconfig(self.im_, image=image_tk)
-        else:
-            self.im = self.disabled_tk
-            # self.configure(image=self.disabled_tk)
-            self.itemconfig(self.im_, image=self.disabled_tk)
+        self.after(int(1000 / fps), self.capture)
 
-        self.after(self.next_frames, self.capture)
+    def showImage(self, image_pil):
+        if image_pil is None:
+            if self.im is not self.disabled_tk:
+                self.im = self.disabled_tk
+                # self.configure(image=self.disabled_tk)
+                self.itemconfig(self.im_, image=self.disabled_tk)
+            return
+
+        if self.preview_tk is None or (self.preview_tk.width(), self.preview_tk.height()) != image_pil.size:
+            # 最初の画像と表示サイズが変わった場合のみ作り直す
+            self.preview_tk = ImageTk.PhotoImage(image_pil)
+        else:
+            self.preview_tk.paste(image_pil)
+        if self.im is not self.preview_tk:
+            self.im = self.preview_tk
+            self.itemconfig(self.im_, image=self.preview_tk)
 
     def saveCapture(self):
         self.camera.saveCapture()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GUIを使用せずに複数台のSwitchのコマンドを1つのプロセスで実行する
+
+台(unit)ごとにプロファイルの設定を読み込み、専用のカメラ・シリアルポート・コマンドのスレッドを割り当てる。
+テンプレート画像のキャッシュ(ImageProcPythonCommand.template_cache)とテンプレートマッチング用の
+スレッドプール(ImageProcessing.getMatchExecutor)はプロセス内のすべての台で共有される。
+
+台の一覧はINIファイルで指定する(セクション名が台の名前):
+    [switch1]
+    profile = switch1
+    command = 自動化スクリプトのNAME
+    ; 省略した場合はプロファイルの設定(camera_id)を使用する。数字以外は動画ファイル・画像フォルダ(仮想カメラ)
+    camera = 0
+    ; 省略した場合はプロファイルの設定(com_port, com_port_name)を使用する。loopback/ptyは仮想シリアルポート
+    serial = COM3
+
+使い方(SerialControllerフォルダで実行する):
+    python -m HeadlessRunner units.ini [--status-interval 10] [--status-file status.json]
+    # 1台のみ実行する場合は台の一覧の代わりに自動化スクリプトのNAMEを指定する
+    python -m HeadlessRunner -c 自動化スクリプトのNAME [--profile default] [--camera 0] [--serial COM3]
+    # 自動化スクリプトの一覧を表示する
+    python -m HeadlessRunner --list
+
+tkinterがない環境でも動作する(ダイアログは表示せずに各widgetの初期値を使用する)。
+
+LINE・Discordの通知設定はプロセス内で共通のため、台ごとのプロファイルの通知設定は使用されない。
+"""
+
+from __future__ import annotations
+
+import argparse
+import configparser
+import json
+import os
+import threading
+import time
+from logging import getLogger, DEBUG, NullHandler
+from typing import List, Optional
+
+import Utility as util
+from Camera import Camera
+from Clock import RealClock, default_clock
+from CommandLoader import CommandLoader
+from Commands import PythonCommandBase
+from Commands.Keys import KeyPress
+from Commands.Sender import Sender
+from ImageProcessing import getMatchExecutor
+from Settings import GuiSettings
+from VirtualDevices import LoopbackSerial, PtySerial
+
+logger = getLogger(__name__)
+logger.addHandler(NullHandler())
+logger.setLevel(DEBUG)
+logger.propagate = True
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+
+def loadCommandClasses() -> list:
+    """
+    Commands/PythonCommands以下の自動化スクリプトを読み込む
+    tkinterを直接使用しているなど、読み込めないファイルは警告を表示して読み飛ばす
+    """
+    path = util.ospath("Commands/PythonCommands")
+    loader = CommandLoader(path, PythonCommandBase.PythonCommand)
+    for name in util.getModuleNames(path):
+        try:
+            loader.modules.extend(util.importAllModules(path, [name]))
+        except Exception as e:
+            logger.warning(f"Skip loading {name}: {type(e).__name__}: {e}")
+            print(f"Skip loading {name}: {type(e).__name__}: {e}")
+    return loader.getCommandClasses()
+
+
+def findCommandClass(name: str, classes: list = None):
+    """
+    NAME(フォルダ名を含む表示名・含まない名前のどちらでもよい)またはクラス名から自動化スクリプトを探す
+    """
+    if classes is None:
+        classes = loadCommandClasses()
+    for c in classes:
+        if c.NAME == name:
+            return c
+    candidates = [c for c in classes if c.NAME.rsplit(" (", 1)[0] == name or c.__name__ == name]
+    if len(candidates) > 1:
+        raise ValueError(f"Command name '{name}' is ambiguous: {[c.NAME for c in candidates]}")
+    if not candidates:
+        raise ValueError(f"Command '{name}' not found.")
+    return candidates[0]
+
+
+class HeadlessUnit:
+    """
+    1台分のカメラ・シリアルポート・自動化スクリプトのスレッド
+    状態(state)はidle→running→finished/error/stoppedと変化する
+    """
+
+    def __init__(
+        self,
+        name: str,
+        profile: str = "default",
+        command: Optional[str] = None,
+        camera: Optional[str] = None,
+        serial: Optional[str] = None,
+        clock: RealClock = default_clock,
+    ):
+        self._logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+
+        self.name = name
+        self.profile = profile
+        self.command_name = command
+        self.camera_source = camera
+        self.serial_port = serial
+        # 台ごとにコマンドの待機の傾向が異なるため、別のPrecisionSleeperを使用する
+        self.clock = clock.fork()
+        # プロファイルの設定はGUIと同じGuiSettingsで読み込む(tkinterがない場合はTkStandInの変数を使用する)
+        # 設定ファイルがない場合はGUIと同様に既定の設定で作成される
+        profile_dir = os.path.join(PROFILE_DIR, profile)
+        if not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+            self._logger.warning(f"Profile '{profile}' does not exist. Created it with default settings.")
+        self.settings = GuiSettings(os.path.join(profile_dir, "settings.ini"))
+
+        self.camera = None
+        self.sender = None
+        self.command = None
+        self.thread = None
+        self.state = "idle"
+        self.started_at = None
+        self.finished_at = None
+        self.__finished_normally = False
+
+    def open(self):
+        """
+        カメラとシリアルポートを開く
+        """
+        settings = self.settings
+        self.camera = Camera(settings.fps.get(), use_grabber=settings.is_use_frame_grabber.get())
+        source = self.camera_source if self.camera_source is not None else settings.camera_id.get()
+        if str(source).isdigit():
+            self.camera.openCamera(int(source))
+        else:
+            self.camera.openVirtualCamera(source, clock=self.clock)
+
+        self.sender = Sender(
+            settings.is_show_serial.get(),
+            use_writer=settings.is_use_serial_writer.get(),
+            coalesce=settings.is_coalesce_serial_write.get(),
+        )
+        if self.serial_port == "loopback":
+            self.sender.openVirtualSerial(LoopbackSerial(clock=self.clock))
+        elif self.serial_port == "pty":
+            self.sender.openVirtualSerial(PtySerial(clock=self.clock))
+        elif self.serial_port is not None:
+            self.sender.openSerial(0, self.serial_port, settings.baud_rate.get())
+        else:
+            self.sender.openSerial(settings.com_port.get(), settings.com_port_name.get(), settings.baud_rate.get())
+
+    def start(self, command_class=None):
+        """
+        自動化スクリプトをスレッドで実行する
+        command_classを省略した場合はcommand(NAME)から探す
+        """
+        if self.camera is None or self.sender is None:
+            self.open()
+        if command_class is None:
+            command_class = findCommandClass(self.command_name)
+        self.command_name = command_class.NAME
+
+        if issubclass(command_class, PythonCommandBase.ImageProcPythonCommand):
+            self.command = command_class(self.camera)
+        else:
+            self.command = command_class()
+        self.command.clock = self.clock
+        # 送信データの形式は台ごとに異なる場合があるため、KeyPressはクラス変数ではなく台ごとに設定する
+        self.command.keys = KeyPress(self.sender)
+        self.command.keys.serial_data_format_name = self.settings.serial_data_format_name.get()
+        self.command.keys.init_hat()
+
+        self.__finished_normally = False
+        self.state = "running"
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self._logger.info(f"[{self.name}] Start {self.command_name}")
+        self.command.start(self.sender, self.__onFinished)
+        self.thread = self.command.thread
+
+    def __onFinished(self):
+        # 自動化スクリプトが正常に終了した場合(finishまたは停止要求)に呼び出される
+        self.__finished_normally = True
+
+    def stop(self, timeout: float = 5.0):
+        """
+        自動化スクリプトに停止要求を送り、終了するまで待機する
+        """
+        if self.command is not None and self.isRunning():
+            self.command.end(self.sender)
+            self.thread.join(timeout=timeout)
+            if self.state == "running":
+                self.state = "stopped"
+                self.finished_at = time.perf_counter()
+
+    def isRunning(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def update(self):
+        """
+        スレッドの終了を確認して状態を更新する
+        """
+        if self.state == "running" and not self.isRunning():
+            self.finished_at = time.perf_counter()
+            self.state = "finished" if self.__finished_normally else "error"
+            self._logger.info(f"[{self.name}] {self.command_name} {self.state}")
+
+    def close(self):
+        """
+        カメラとシリアルポートを閉じる
+        """
+        self.stop()
+        if self.sender is not None and self.sender.isOpened():
+            self.sender.closeSerial()
+        if self.camera is not None:
+            self.camera.destroy()
+
+    def getStatus(self) -> dict:
+        """
+        台の状態(実行中の自動化スクリプト・経過時間・最新フレーム・送信の計測値)
+        """
+        self.update()
+        status = {
+            "name": self.name,
+            "profile": self.profile,
+            "command": self.command_name,
+            "state": self.state,
+            "elapsed_s": None,
+        }
+        if self.started_at is not None:
+            end = self.finished_at if self.finished_at is not None else time.perf_counter()
+            status["elapsed_s"] = end - self.started_at
+        if self.camera is not None:
+            timestamp = self.camera.frame_timestamp
+            status["frame_seq"] = self.camera.frame_seq
+            status["frame_age_s"] = self.clock.now() - timestamp if timestamp else None
+        if self.sender is not None:
+            metrics = self.sender.getMetrics()
+            status["serial"] = {
+                "opened": self.sender.isOpened(),
+                "packets": metrics["packets"],
+                "recent_packets_per_s": metrics["recent_packets_per_s"],
+                "max_write_ms": metrics["max_write_ms"],
+                "errors": metrics["errors"],
+                "pending": metrics["writer"]["pending"],
+            }
+        return status
+
+
+class HeadlessRunner:
+    """
+    複数台のHeadlessUnitをまとめて実行し、状態を定期的に報告する
+    """
+
+    def __init__(self, units: List[HeadlessUnit]):
+        self._logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+
+        self.units = units
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def fromFile(cls, filename: str, clock: RealClock = default_clock) -> HeadlessRunner:
+        """
+        台の一覧(INIファイル)から作成する
+        """
+        config = configparser.ConfigParser()
+        config.optionxform = str
+        config.read(filename, encoding="utf-8")
+        units = []
+        for name in config.sections():
+            section = config[name]
+            if not section.get("command"):
+                raise ValueError(f"Unit '{name}' has no command.")
+            units.append(
+                HeadlessUnit(
+                    name,
+                    profile=section.get("profile", "default"),
+                    command=section.get("command"),
+                    camera=section.get("camera"),
+                    serial=section.get("serial"),
+                    clock=clock,
+                )
+            )
+        return cls(units)
+
+    def start(self):
+        """
+        すべての台の自動化スクリプトを実行する(自動化スクリプトの読み込みは1回のみ)
+        """
+        classes = loadCommandClasses()
+        for unit in self.units:
+            try:
+                unit.start(findCommandClass(unit.command_name, classes))
+            except Exception as e:
+                unit.state = "error"
+                self._logger.error(f"[{unit.name}] Failed to start: {e}")
+                print(f"[{unit.name}] Failed to start: {e}")
+
+    def stop(self):
+        for unit in self.units:
+            unit.stop()
+
+    def close(self):
+        for unit in self.units:
+            unit.close()
+
+    def isRunning(self) -> bool:
+        return any(unit.isRunning() for unit in self.units)
+
+    def getStatus(self) -> dict:
+        """
+        すべての台の状態と共有しているキャッシュの統計
+        """
+        with self.__lock:
+            return {
+                "units": [unit.getStatus() for unit in self.units],
+                "template_cache": PythonCommandBase.ImageProcPythonCommand.template_cache.stats(),
+                "match_workers": getMatchExecutor()._max_workers,
+            }
+
+    def printStatus(self):
+        for status in self.getStatus()["units"]:
+            elapsed = "-" if status["elapsed_s"] is None else f"{status['elapsed_s']:.1f}s"
+            serial_status = status.get("serial", {})
+            print(
+                f"[{status['name']}] {status['state']:<8} {status['command']}"
+                f" elapsed={elapsed}"
+                f" frame={status.get('frame_seq')} packets={serial_status.get('packets')}"
+                f" errors={serial_status.get('errors')}"
+            )
+
+    def dumpStatus(self, filename: str):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.getStatus(), f, indent=2, ensure_ascii=False)
+
+    def run(self, status_interval: float = 10.0, status_file: Optional[str] = None):
+        """
+        すべての台の自動化スクリプトを実行し、終了するまで状態を定期的に報告する
+        Ctrl+Cで停止する
+        """
+        self.start()
+        try:
+            while self.isRunning():
+                deadline = time.monotonic() + status_interval
+                while self.isRunning() and time.monotonic() < deadline:
+                    time.sleep(0.2)
+                if not self.isRunning():
+                    # 終了後の状態はfinallyで報告する
+                    break
+                self.printStatus()
+                if status_file:
+                    self.dumpStatus(status_file)
+        except KeyboardInterrupt:
+            print("Stopping all units...")
+            self.stop()
+        finally:
+            self.close()
+            self.printStatus()
+            if status_file:
+                self.dumpStatus(status_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Poke-Controller commands for multiple units without GUI")
+    parser.add_argument("units", type=str, nargs="?", help="INI file listing units (profile, command, camera, serial)")
+    parser.add_argument("--command", "-c", type=str, default=None, help="run a single command with this NAME")
+    parser.add_argument("--profile", "-p", type=str, default="default", help="profile used with --command")
+    parser.add_argument("--camera", type=str, default=None, help="camera id or video/image folder for --command")
+    parser.add_argument("--serial", type=str, default=None, help="serial port name or loopback/pty for --command")
+    parser.add_argument("--list", action="store_true", help="list available commands")
+    parser.add_argument("--status-interval", type=float, default=10.0, help="seconds between status reports")
+    parser.add_argument("--status-file", type=str, default=None, help="write the latest status to this JSON file")
+    args = parser.parse_args()
+
+    if args.list:
+        for c in loadCommandClasses():
+            print(c.NAME)
+        return
+    if args.command is not None:
+        unit = HeadlessUnit(
+            args.profile, profile=args.profile, command=args.command, camera=args.camera, serial=args.serial
+        )
+        runner = HeadlessRunner([unit])
+    elif args.units is not None:
+        runner = HeadlessRunner.fromFile(args.units)
+    else:
+        parser.error("specify a units file or --command")
+    runner.run(status_interval=args.status_interval, status_file=args.status_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,44 @@
 from __future__ import annotations
 
 import cv2
-from numpy import ndarray, array, argmax
+from numpy import ndarray, array, argmax, dtype, empty, random, zeros
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import time
+from functools import lru_cache
 from typing import List, Tuple, Optional
 from logging import getLogger, DEBUG, NullHandler
 
+# isContainTemplate_batchの戻り値の型(x, yはトリミング前の画像上の座標)
+MATCH_RESULT_DTYPE = dtype(
+    [
+        ("max_val", "f4"),
+        ("x", "i4"),
+        ("y", "i4"),
+        ("width", "i4"),
+        ("height", "i4"),
+        ("judge", "?"),
+    ]
+)
+
+_match_executor = None
+_match_executor_lock = threading.Lock()
+
+
+def getMatchExecutor() -> ThreadPoolExecutor:
+    """
+    テンプレートマッチング用のスレッドプールを取得する(プロセス内で共有)
+    OpenCVは処理中にGILを解放するため、複数のテンプレートマッチングを並列に実行できる。
+    """
+    global _match_executor
+    with _match_executor_lock:
+        if _match_executor is None:
+            max_workers = max(1, min(4, os.cpu_count() or 1))
+            _match_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="TemplateMatch")
+        return _match_executor
+
 
 def crop_image(image: ndarray, crop: List[int] = None) -> ndarray:
     """
@@ -38,31 +71,119 @@ def crop_image_extend(image: ndarray, crop_fmt: int | str = None, crop: List[int
     crop_fmt=14: [y軸始点, トリミング後の画像のサイズ(縦), x軸始点, トリミング後の画像のサイズ(横)]
     """
 
+    # crop_fmtが指定されていない場合はトリミングしない
+    if str(crop_fmt) not in CROP_FORMATS:
+        return image
     try:
-        # pillow形式
-        if crop_fmt == 1 or crop_fmt == "1":
-            cropped_image = image[crop[1] : crop[3], crop[0] : crop[2]]
-        elif crop_fmt == 2 or crop_fmt == "2":
-            cropped_image = image[crop[1] : crop[1] + crop[3], crop[0] : crop[0] + crop[2]]
-        elif crop_fmt == 3 or crop_fmt == "3":
-            cropped_image = image[crop[2] : crop[3], crop[0] : crop[1]]
-        elif crop_fmt == 4 or crop_fmt == "4":
-            cropped_image = image[crop[2] : crop[2] + crop[3], crop[0] : crop[0] + crop[1]]
-        # opencv形式
-        elif crop_fmt == 11 or crop_fmt == "11":
-            cropped_image = image[crop[0] : crop[2], crop[1] : crop[3]]
-        elif crop_fmt == 12 or crop_fmt == "12":
-            cropped_image = image[crop[0] : crop[0] + crop[2], crop[1] : crop[1] + crop[3]]
-        elif crop_fmt == 13 or crop_fmt == "13":
-            cropped_image = image[crop[0] : crop[1], crop[2] : crop[3]]
-        elif crop_fmt == 14 or crop_fmt == "14":
-            cropped_image = image[crop[0] : crop[0] + crop[1], crop[2] : crop[2] + crop[3]]
-        else:
-            cropped_image = image
+        return compileROI(crop_fmt, crop).view(image)
     except Exception:
-        cropped_image = image
+        return image
 
-    return cropped_image
+
+# 対応しているcrop_fmt
+CROP_FORMATS = ("1", "2", "3", "4", "11", "12", "13", "14")
+
+
+def _convertCropToCv2(crop_fmt: int | str, crop: Tuple[int, ...]) -> List[int]:
+    """
+    cropをopencv形式([y軸始点, y軸終点, x軸始点, x軸終点])に変換する
+    crop_fmtが対応していない形式の場合はcrop_fmt=1として扱う
+    """
+    crop_fmt = str(crop_fmt)
+    # pillow形式
+    if crop_fmt == "2":
+        return [crop[1], crop[1] + crop[3], crop[0], crop[0] + crop[2]]
+    elif crop_fmt == "3":
+        return [crop[2], crop[3], crop[0], crop[1]]
+    elif crop_fmt == "4":
+        return [crop[2], crop[2] + crop[3], crop[0], crop[0] + crop[1]]
+    # opencv形式
+    elif crop_fmt == "11":
+        return [crop[0], crop[2], crop[1], crop[3]]
+    elif crop_fmt == "12":
+        return [crop[0], crop[0] + crop[2], crop[1], crop[1] + crop[3]]
+    elif crop_fmt == "13":
+        return [crop[0], crop[1], crop[2], crop[3]]
+    elif crop_fmt == "14":
+        return [crop[0], crop[0] + crop[1], crop[2], crop[2] + crop[3]]
+    else:
+        return [crop[1], crop[3], crop[0], crop[2]]
+
+
+class ROI:
+    """
+    crop_fmtとcropから事前に変換したトリミング範囲
+    viewはコピーを行わずに画像の一部を参照する。
+    preprocessはROIのサイズに合わせて確保したバッファに前処理の結果を書き込むため、
+    同じ範囲を繰り返し処理する場合にフレームごとのメモリ確保が発生しない。
+    compileROIで取得したROIは共有されるため、バッファはスレッドごとに保持する。
+    """
+
+    def __init__(self, crop_fmt: int | str = "", crop: List[int] = []):
+        try:
+            self.cv2 = tuple(_convertCropToCv2(crop_fmt, crop))
+        except Exception:
+            self.cv2 = ()
+        # pillow形式([x軸始点, y軸始点, x軸終点, y軸終点])
+        self.pillow = (self.cv2[2], self.cv2[0], self.cv2[3], self.cv2[1]) if self.cv2 else ()
+        self.slices = (slice(self.cv2[0], self.cv2[1]), slice(self.cv2[2], self.cv2[3])) if self.cv2 else None
+        self.__buffers = threading.local()
+
+    def __bool__(self) -> bool:
+        return bool(self.cv2)
+
+    def view(self, image: ndarray) -> ndarray:
+        """
+        画像のトリミング範囲を返す(コピーは行わない)
+        """
+        if self.slices is None:
+            return image
+        return image[self.slices]
+
+    def getBuffer(self, key, shape: tuple) -> ndarray:
+        """
+        前処理の結果を書き込むバッファを取得する(スレッドごと・用途ごとに再利用する)
+        """
+        buffers = getattr(self.__buffers, "buffers", None)
+        if buffers is None:
+            buffers = self.__buffers.buffers = {}
+        buffer = buffers.get(key)
+        if buffer is None or buffer.shape != shape:
+            buffer = buffers[key] = empty(shape, dtype="uint8")
+        return buffer
+
+    def preprocess(
+        self,
+        image: ndarray,
+        use_gray: bool = True,
+        BGR_range: Optional[dict] = None,
+        threshold_binary: Optional[int] = None,
+    ) -> Tuple[ndarray, int, int]:
+        """
+        トリミング範囲に対してdoPreprocessImageと同じ前処理を行う
+        結果はROIのバッファに書き込まれるため、同じスレッドで同じ前処理を再度行うと上書きされる
+        """
+        src = self.view(image)
+        if not use_gray and BGR_range is None and threshold_binary is None:
+            return src, src.shape[1], src.shape[0]
+        shape = src.shape[:2] if (use_gray or BGR_range is not None) else src.shape
+        dst = self.getBuffer((use_gray, BGR_range is not None), shape)
+        return doPreprocessImage(
+            src, use_gray=use_gray, BGR_range=BGR_range, threshold_binary=threshold_binary, dst=dst
+        )
+
+
+@lru_cache(maxsize=256)
+def _compileROI(crop_fmt: str, crop: Tuple[int, ...]) -> ROI:
+    return ROI(crop_fmt, crop)
+
+
+def compileROI(crop_fmt: int | str = "", crop: List[int] = []) -> ROI:
+    """
+    crop_fmtとcropからROIを作成する
+    同じ指定に対しては作成済みのROIを返す
+    """
+    return _compileROI(str(crop_fmt), tuple(crop) if crop is not None else ())
 
 
 def getInterframeDiff(frame1: ndarray, frame2: ndarray, frame3: ndarray, threshold: float) -> ndarray:
@@ -108,28 +229,262 @@ def doPreprocessImage(
     crop: List[int] = None,
     BGR_range: Optional[dict] = None,
     threshold_binary: Optional[int] = None,
+    dst: Optional[ndarray] = None,
 ) -> Tuple[ndarray, int, int]:
     """
     画像をトリミングしてグレースケール化/2値化する
+    dstに処理後の画像と同じサイズのバッファを渡すと、新たにメモリを確保せずにdstに結果を書き込む
     2値化関連のContributor: mikan kochan 空太 (敬称略)
     """
     src = crop_image(image, crop=crop)  # トリミング
 
     if use_gray:
-        src = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)  # グレースケール化
+        src = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=dst)  # グレースケール化
     elif BGR_range is not None:  # 2値化
         src = cv2.inRange(
-            src, array(BGR_range["lower"]), array(BGR_range["upper"])
+            src, array(BGR_range["lower"]), array(BGR_range["upper"]), dst=dst
         )  # inRangeで元画像を２値化(指定した色の範囲を抽出できる)
 
     if threshold_binary is not None:
-        _, src = cv2.threshold(src, threshold_binary, 255, cv2.THRESH_BINARY)
+        _, src = cv2.threshold(src, threshold_binary, 255, cv2.THRESH_BINARY, dst=dst)
 
     width, height = src.shape[1], src.shape[0]  # テンプレート画像のサイズ
 
     return src, width, height
 
 
+def _freeze_BGR_range(BGR_range: Optional[dict]) -> Optional[tuple]:
+    """
+    BGR_rangeをキャッシュのキーとして使えるようにタプルへ変換する
+    """
+    if BGR_range is None:
+        return None
+    return (tuple(BGR_range["lower"]), tuple(BGR_range["upper"]))
+
+
+class TemplateCache:
+    """
+    読み込み済みの画像と前処理済みのテンプレート画像を保持するLRUキャッシュ
+    キーはファイルの絶対パス、ファイルの更新時刻および前処理のパラメータ。
+    ファイルが更新された場合は更新時刻が変わるため自動的に読み込み直す。
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__cache = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __get(self, key):
+        with self.__lock:
+            if key in self.__cache:
+                self.__cache.move_to_end(key)
+                self.hits += 1
+                return self.__cache[key]
+            self.misses += 1
+            return None
+
+    def __put(self, key, value):
+        with self.__lock:
+            self.__cache[key] = value
+            self.__cache.move_to_end(key)
+            while len(self.__cache) > self.maxsize:
+                self.__cache.popitem(last=False)
+                self.evictions += 1
+
+    def getImage(self, path: str, mode: str = "color") -> Optional[ndarray]:
+        """
+        画像を読み込む(読み込み済みであればキャッシュから返す)
+        """
+        try:
+            abspath = os.path.abspath(path)
+            mtime = os.stat(abspath).st_mtime_ns
+        except (OSError, TypeError, ValueError):
+            # ファイルが存在しない場合はキャッシュせず従来通りの読み込みを行う
+            return getImage(path, mode=mode)
+
+        key = ("image", abspath, mtime, mode)
+        image = self.__get(key)
+        if image is None:
+            image = getImage(abspath, mode=mode)
+            if image is not None:
+                self.__put(key, image)
+        return image
+
+    def getTemplate(
+        self,
+        path: str,
+        use_gray: bool = True,
+        crop: List[int] = None,
+        BGR_range: Optional[dict] = None,
+        threshold_binary: Optional[int] = None,
+    ) -> Tuple[ndarray, int, int]:
+        """
+        テンプレート画像を読み込み、前処理(トリミング/グレースケール化/2値化)を行った結果を返す
+        """
+        try:
+            abspath = os.path.abspath(path)
+            mtime = os.stat(abspath).st_mtime_ns
+        except (OSError, TypeError, ValueError):
+            return doPreprocessImage(
+                getImage(path, mode="color"),
+                use_gray=use_gray,
+                crop=crop,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+            )
+
+        key = (
+            "template",
+            abspath,
+            mtime,
+            use_gray,
+            tuple(crop) if crop else None,
+            _freeze_BGR_range(BGR_range),
+            threshold_binary,
+        )
+        res = self.__get(key)
+        if res is None:
+            res = doPreprocessImage(
+                self.getImage(abspath, mode="color"),
+                use_gray=use_gray,
+                crop=crop,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+            )
+            self.__put(key, res)
+        return res
+
+    def clear(self):
+        with self.__lock:
+            self.__cache.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        """
+        キャッシュの利用状況を返す
+        """
+        with self.__lock:
+            return {
+                "size": len(self.__cache),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class FrameCache:
+    """
+    1フレーム分の派生画像(グレースケール/2値化/トリミング)を保持するキャッシュ
+    同じフレームに対して複数のテンプレートマッチングを行う場合に、前処理を1回で済ませるために使用する。
+    グレースケール化はフレーム全体に対して1回だけ行い、トリミング範囲ごとの画像はその一部を参照する。
+    bindでフレームの通し番号が変わると保持している画像は破棄される。
+    処理結果はcompileROIで取得したROIのバッファ(スレッドごと)に書き込むため、フレームごとのメモリ確保は発生しない。
+    バッファは次のフレームでも再利用するため、取得した画像は次のフレームで上書きされる。
+    """
+
+    def __init__(self):
+        self.image = None
+        self.seq = None
+        self.hits = 0
+        self.misses = 0
+        self.__images = {}
+
+    def bind(self, image: ndarray, seq: Optional[int] = None):
+        """
+        キャッシュ対象のフレームを設定する
+        """
+        if seq is not None and seq == self.seq and image is self.image:
+            return
+        self.image = image
+        self.seq = seq
+        self.__images = {}
+
+    def isBound(self, image: ndarray) -> bool:
+        return self.image is not None and image is self.image
+
+    @staticmethod
+    def __compileROI(crop: List[int] = None) -> ROI:
+        # cropはopencv形式([y軸始点, y軸終点, x軸始点, x軸終点])
+        return compileROI(13, crop)
+
+    def __getFullGray(self) -> ndarray:
+        key = ("gray",)
+        if key in self.__images:
+            self.hits += 1
+            return self.__images[key]
+        self.misses += 1
+        dst = self.__compileROI().getBuffer(("frame_cache", "gray"), self.image.shape[:2])
+        gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY, dst=dst)
+        self.__images[key] = gray
+        return gray
+
+    def getCrop(self, crop: List[int] = None) -> ndarray:
+        """
+        フレームをトリミングした画像を返す(コピーは行わない)
+        """
+        return crop_image(self.image, crop=crop)
+
+    def getGray(self, crop: List[int] = None) -> ndarray:
+        """
+        フレーム全体をグレースケール化した画像(をトリミングしたもの)を返す
+        """
+        return crop_image(self.__getFullGray(), crop=crop)
+
+    def preprocess(
+        self,
+        use_gray: bool = True,
+        crop: List[int] = None,
+        BGR_range: Optional[dict] = None,
+        threshold_binary: Optional[int] = None,
+    ) -> Tuple[ndarray, int, int]:
+        """
+        doPreprocessImageと同じ前処理を行う
+        同じパラメータで処理済みであれば保持している結果を返す。
+        """
+        crop_key = tuple(crop) if crop else None
+        # グレースケール化する場合はBGR_rangeを使用しない(doPreprocessImageと同じ)
+        BGR_range_key = None if use_gray else _freeze_BGR_range(BGR_range)
+        key = ("preprocess", crop_key, use_gray, BGR_range_key, threshold_binary)
+        if key in self.__images:
+            self.hits += 1
+            return self.__images[key]
+        self.misses += 1
+
+        # 各処理は画素単位のため、フレーム全体に対して処理済みの画像があればトリミングするだけで良い
+        roi = self.__compileROI(crop)
+        buffer_key = ("frame_cache", use_gray, BGR_range_key, threshold_binary)
+        full_key = ("preprocess", None, use_gray, BGR_range_key, threshold_binary)
+        if crop_key is not None and full_key in self.__images:
+            src = roi.view(self.__images[full_key][0])
+            res = (src, src.shape[1], src.shape[0])
+        elif use_gray:
+            src = roi.view(self.__getFullGray())
+            if threshold_binary is not None:
+                _, src = cv2.threshold(
+                    src, threshold_binary, 255, cv2.THRESH_BINARY, dst=roi.getBuffer(buffer_key, src.shape)
+                )
+            res = (src, src.shape[1], src.shape[0])
+        else:
+            src = roi.view(self.image)
+            if BGR_range is not None:
+                dst = roi.getBuffer(buffer_key, src.shape[:2])
+            elif threshold_binary is not None:
+                dst = roi.getBuffer(buffer_key, src.shape)
+            else:
+                dst = None
+            res = doPreprocessImage(
+                src, use_gray=use_gray, BGR_range=BGR_range, threshold_binary=threshold_binary, dst=dst
+            )
+        self.__images[key] = res
+        return res
+
+
 def opneImage(image: ndarray, crop: List[int] = None, title="image"):
     """
     キー入力があるまで画像を表示する
@@ -141,6 +496,256 @@ def opneImage(image: ndarray, crop: List[int] = None, title="image"):
     cv2.destroyAllWindows()
 
 
+class _DeviceTemplateCache:
+    """
+    デバイスに転送済みのテンプレート画像を保持する
+    同じndarrayオブジェクト(TemplateCacheから取得したテンプレート画像など)に対して転送済みのデータを再利用する
+    """
+
+    def __init__(self, upload, maxsize: int = 64):
+        self.__upload = upload
+        self.__maxsize = maxsize
+        self.__cache = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_image: ndarray):
+        key = id(template_image)
+        with self.__lock:
+            entry = self.__cache.get(key)
+            # 保持しているndarrayと同じオブジェクトの場合のみ再利用する(idの再利用対策)
+            if entry is not None and entry[0] is template_image:
+                self.__cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            device_image = self.__upload(template_image)
+            self.__cache[key] = (template_image, device_image)
+            self.__cache.move_to_end(key)
+            while len(self.__cache) > self.__maxsize:
+                self.__cache.popitem(last=False)
+            return device_image
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__cache.clear()
+
+
+class MatchBackend:
+    """
+    テンプレートマッチングを実行するバックエンドの基底クラス
+    matchはcv2.matchTemplateと同じ形式の類似度のマップ(ndarray)を返す
+    resultに適切なサイズのfloat32のバッファを渡すと、可能な場合はそこに結果を書き込む
+    """
+
+    name = ""
+
+    @classmethod
+    def isAvailable(cls) -> bool:
+        return True
+
+    def match(
+        self,
+        image: ndarray,
+        template_image: ndarray,
+        method: int,
+        mask_image: ndarray = None,
+        result: ndarray = None,
+    ) -> ndarray:
+        raise NotImplementedError
+
+
+class CpuMatchBackend(MatchBackend):
+    """
+    CPU(cv2.matchTemplate)でテンプレートマッチングを行う
+    """
+
+    name = "cpu"
+
+    def match(
+        self,
+        image: ndarray,
+        template_image: ndarray,
+        method: int,
+        mask_image: ndarray = None,
+        result: ndarray = None,
+    ) -> ndarray:
+        return cv2.matchTemplate(image, template_image, method, result=result, mask=mask_image)
+
+
+class OpenCLMatchBackend(MatchBackend):
+    """
+    OpenCL(cv2.UMat)でテンプレートマッチングを行う
+    テンプレート画像は転送済みのUMatを再利用する
+    """
+
+    name = "opencl"
+
+    @classmethod
+    def isAvailable(cls) -> bool:
+        try:
+            return cv2.ocl.haveOpenCL()
+        except Exception:
+            return False
+
+    def __init__(self):
+        # UMatを渡したcv2の関数はOpenCLで処理されるため、cv2.ocl.setUseOpenCL(プロセス全体の設定)は変更しない
+        self.templates = _DeviceTemplateCache(cv2.UMat)
+
+    def match(
+        self,
+        image: ndarray,
+        template_image: ndarray,
+        method: int,
+        mask_image: ndarray = None,
+        result: ndarray = None,
+    ) -> ndarray:
+        mask = cv2.UMat(mask_image) if isinstance(mask_image, ndarray) else None
+        res = cv2.matchTemplate(cv2.UMat(image), self.templates.get(template_image), method, mask=mask)
+        return res.get()
+
+
+class CudaMatchBackend(MatchBackend):
+    """
+    CUDA(cv2.cuda)でテンプレートマッチングを行う
+    マッチャーは画像の種類と比較方式ごとに作成したものを再利用し、テンプレート画像はデバイスに保持する
+    マスクを使用する場合はCUDAが対応していないためCPUで処理する
+    """
+
+    name = "cuda"
+    __types = {1: cv2.CV_8UC1, 3: cv2.CV_8UC3, 4: cv2.CV_8UC4}
+
+    @classmethod
+    def isAvailable(cls) -> bool:
+        try:
+            return cv2.cuda.getCudaEnabledDeviceCount() > 0
+        except Exception:
+            return False
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__gsrc = cv2.cuda_GpuMat()
+        self.__gresult = cv2.cuda_GpuMat()
+        self.__matchers = {}
+        self.__cpu = CpuMatchBackend()
+        self.templates = _DeviceTemplateCache(self._upload)
+
+    @staticmethod
+    def _upload(image: ndarray):
+        gimage = cv2.cuda_GpuMat()
+        gimage.upload(image)
+        return gimage
+
+    def match(
+        self,
+        image: ndarray,
+        template_image: ndarray,
+        method: int,
+        mask_image: ndarray = None,
+        result: ndarray = None,
+    ) -> ndarray:
+        if isinstance(mask_image, ndarray):
+            return self.__cpu.match(image, template_image, method, mask_image=mask_image, result=result)
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        with self.__lock:
+            matcher = self.__matchers.get((channels, method))
+            if matcher is None:
+                matcher = cv2.cuda.createTemplateMatching(self.__types[channels], method)
+                self.__matchers[(channels, method)] = matcher
+            self.__gsrc.upload(image)
+            self.__gresult = matcher.match(self.__gsrc, self.templates.get(template_image), self.__gresult)
+            return self.__gresult.download()
+
+
+MATCH_BACKENDS = {
+    CpuMatchBackend.name: CpuMatchBackend,
+    OpenCLMatchBackend.name: OpenCLMatchBackend,
+    CudaMatchBackend.name: CudaMatchBackend,
+}
+_match_backends = {}
+_match_backends_lock = threading.Lock()
+_default_match_backend = CpuMatchBackend.name
+
+
+def getAvailableMatchBackends() -> List[str]:
+    """
+    この環境で使用できるテンプレートマッチングのバックエンド名の一覧を取得する
+    """
+    return [name for name, backend in MATCH_BACKENDS.items() if backend.isAvailable()]
+
+
+def setDefaultMatchBackend(name: str) -> None:
+    """
+    use_gpu=TrueのImageProcessingで使用するバックエンドを設定する(プロファイルのtemplate_match_backend)
+    cpuを設定した場合、use_gpu=TrueのImageProcessingはCUDAを使用する
+    """
+    global _default_match_backend
+    if name not in MATCH_BACKENDS:
+        getLogger(__name__).warning(f"Unknown template match backend: {name}")
+        name = CpuMatchBackend.name
+    _default_match_backend = name
+
+
+def getMatchBackend(name: Optional[str] = None) -> MatchBackend:
+    """
+    テンプレートマッチングのバックエンドを取得する(プロセス内で共有)
+    nameを省略した場合は既定のバックエンドを使用し、使用できない場合はCPUで処理する
+    """
+    if name is None:
+        name = _default_match_backend
+    with _match_backends_lock:
+        backend = _match_backends.get(name)
+        if backend is None:
+            backend_class = MATCH_BACKENDS.get(name)
+            if backend_class is None or not backend_class.isAvailable():
+                getLogger(__name__).warning(f"Template match backend '{name}' is not available. Use CPU instead.")
+                backend_class = CpuMatchBackend
+            try:
+                backend = backend_class()
+            except Exception as e:
+                getLogger(__name__).warning(f"Failed to initialize template match backend '{name}': {e}")
+                backend = CpuMatchBackend()
+            _match_backends[name] = backend
+        return backend
+
+
+def benchmarkMatchBackends(
+    image: ndarray = None, template_image: ndarray = None, iterations: int = 20, names: Optional[List[str]] = None
+) -> dict:
+    """
+    各バックエンドのテンプレートマッチングの処理時間(ms)を計測する
+    使用できないバックエンドは計測せずavailable=Falseとする(CPUのみの環境ではcudaは計測されない)
+    画像を省略した場合は1280x720のグレースケールのランダム画像を使用する
+    """
+    if image is None:
+        image = random.default_rng(0).integers(0, 256, (720, 1280), dtype="uint8")
+    if template_image is None:
+        template_image = image[300:364, 600:728].copy()
+    method = cv2.TM_CCOEFF_NORMED
+    result = {}
+    for name in names if names is not None else MATCH_BACKENDS:
+        if name not in MATCH_BACKENDS or not MATCH_BACKENDS[name].isAvailable():
+            result[name] = {"available": False}
+            continue
+        backend = getMatchBackend(name)
+        backend.match(image, template_image, method)  # 初回の初期化・転送を除外する
+        times = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            res = backend.match(image, template_image, method)
+            cv2.minMaxLoc(res)
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        result[name] = {
+            "available": True,
+            "mean_ms": sum(times) / len(times),
+            "min_ms": times[0],
+            "median_ms": times[len(times) // 2],
+        }
+    return result
+
+
 class ImageProcessing:
     """
     画像に関する処理を行う。
@@ -148,38 +753,63 @@ class ImageProcessing:
 
     __logger = None
     __activate_logger = False
-    __gsrc = None
-    __gtmpl = None
-    __gresult = None
     __use_gpu = False
     image_type = ndarray
+    pyramid_min_template_size = 8  # ピラミッド探索で縮小後のテンプレート画像に必要な最小サイズ(px)
+    pyramid_candidates = 5  # ピラミッド探索で元の解像度で確認する縮小画像上の候補位置の数
+    pyramid_margin = 4  # ピラミッド探索で候補位置の周囲を元の解像度で確認する範囲(縮小画像上のpx)
+    early_exit_tile_size = 128  # 早期終了探索で1回に探索する範囲(テンプレート画像の左上の位置の範囲, px)
+    result_buffer_limit = 16  # スレッドごとに保持するテンプレートマッチングの結果用バッファの最大数
 
-    def __init__(self, use_gpu: bool = False):
+    def __init__(self, use_gpu: bool = False, backend: Optional[str] = None):
         # ロガーを起動する(1回だけ)
         if not self.__activate_logger:
             self.__logger = getLogger(__name__)
             self.__logger.addHandler(NullHandler())
             self.__logger.setLevel(DEBUG)
             self.__logger.propagate = True
-        # GUP使用時、デバイスのメモリを確保する(1回だけ)
-        if use_gpu:
-            """
-            テンプレートマッチングをGPUで行うようにする。
-            うまく設定できたらuse_gpuのフラグをTrueにする。
-            """
-            try:
-                if self.__gsrc is None:
-                    self.__gsrc = cv2.cuda_GpuMat()
-                if self.__gtmpl is None:
-                    self.__gtmpl = cv2.cuda_GpuMat()
-                if self.__gresult is None:
-                    self.__gresult = cv2.cuda_GpuMat()
-                self.__use_gpu = True
-                print("template matching:mask is ignored.")
-            except Exception:
-                self.__use_gpu = False
+        # テンプレートマッチングのバックエンドを設定する
+        # use_gpuがFalseの場合はCPUで処理する
+        # use_gpuがTrueの場合はプロファイルで設定されたバックエンド(cpuの場合はCUDA)を使用する
+        # (使用できない場合はCPUで処理する)
+        if backend is None:
+            if not use_gpu:
+                backend = CpuMatchBackend.name
+            elif _default_match_backend != CpuMatchBackend.name:
+                backend = _default_match_backend
+            else:
+                backend = CudaMatchBackend.name
+        self.__backend = getMatchBackend(backend)
+        self.__use_gpu = self.__backend.name == CudaMatchBackend.name
+        # テンプレートマッチングの結果用バッファ(スレッドごとにサイズ別に保持する)
+        self.__result_buffers = threading.local()
+
+    @property
+    def backend(self) -> MatchBackend:
+        """
+        テンプレートマッチングに使用するバックエンド
+        """
+        return self.__backend
+
+    def getResultBuffer(self, image: ndarray, template_image: ndarray) -> Optional[ndarray]:
+        """
+        テンプレートマッチングの結果を書き込むバッファを取得する
+        同じサイズの探索では同じバッファを再利用する(スレッドごとに保持する)
+        """
+        shape = (image.shape[0] - template_image.shape[0] + 1, image.shape[1] - template_image.shape[1] + 1)
+        if shape[0] <= 0 or shape[1] <= 0:
+            return None
+        buffers = getattr(self.__result_buffers, "buffers", None)
+        if buffers is None:
+            buffers = self.__result_buffers.buffers = OrderedDict()
+        buffer = buffers.get(shape)
+        if buffer is None:
+            buffer = buffers[shape] = empty(shape, dtype="float32")
+            while len(buffers) > self.result_buffer_limit:
+                buffers.popitem(last=False)
         else:
-            self.__use_gpu = False
+            buffers.move_to_end(shape)
+        return buffer
 
     def imwrite(self, filename: str, image: ndarray, params: int = None) -> bool:
         """
@@ -200,30 +830,182 @@ class ImageProcessing:
             self.__logger.error(f"Image Write Error: {e}")
             return False
 
+    def preprocessImage(
+        self,
+        image: ndarray,
+        use_gray: bool = True,
+        crop: List[int] = None,
+        BGR_range: Optional[dict] = None,
+        threshold_binary: Optional[int] = None,
+        frame_cache: Optional[FrameCache] = None,
+    ) -> Tuple[ndarray, int, int]:
+        """
+        テンプレートマッチング対象画像を加工する
+        frame_cacheがimageに設定されている場合はキャッシュを使用する
+        """
+        if frame_cache is not None and frame_cache.isBound(image):
+            return frame_cache.preprocess(
+                use_gray=use_gray, crop=crop, BGR_range=BGR_range, threshold_binary=threshold_binary
+            )
+        return doPreprocessImage(
+            image, use_gray=use_gray, crop=crop, BGR_range=BGR_range, threshold_binary=threshold_binary
+        )
+
     def doTemplateMatch(
-        self, image: ndarray, template_image: ndarray, mask_image: ndarray = None
+        self,
+        image: ndarray,
+        template_image: ndarray,
+        mask_image: ndarray = None,
+        pyramid_levels: int = 0,
+        threshold: Optional[float] = None,
     ) -> Tuple[float, tuple]:
         """
         テンプレートマッチングをする
         画像は必要に応じて事前にグレースケール化やトリミングをしておく必要がある
+        pyramid_levelsが1以上の場合はdoTemplateMatchPyramidで探索する(thresholdはその場合のみ使用する)
         """
+        if pyramid_levels > 0:
+            return self.doTemplateMatchPyramid(
+                image, template_image, mask_image, pyramid_levels=pyramid_levels, threshold=threshold
+            )
+
         # 比較方式を設定する
         method = cv2.TM_CCORR_NORMED if isinstance(mask_image, ndarray) else cv2.TM_CCOEFF_NORMED
 
         # テンプレートマッチングをする
-        if self.__use_gpu:  # GPUを使用する場合(マスク非対応)
-            print("template matching mode:GPU")
-            self.__gsrc.upload(image)
-            self.__gtmpl.upload(template_image)
-            matcher = cv2.cuda.createTemplateMatching(cv2.CV_8UC1, method)
-            self.__gresult = matcher.match(self.__gsrc, self.__gtmpl)
-            res = self.gresult.download()
-        else:
-            res = cv2.matchTemplate(image, template_image, method, mask=mask_image)
+        res = self.__backend.match(
+            image,
+            template_image,
+            method,
+            mask_image=mask_image,
+            result=self.getResultBuffer(image, template_image),
+        )
         _, max_val, _, max_loc = cv2.minMaxLoc(res)  # 結果から類似度と類似度が最大となる場所を抽出
 
         return max_val, max_loc
 
+    def doTemplateMatchPyramid(
+        self,
+        image: ndarray,
+        template_image: ndarray,
+        mask_image: ndarray = None,
+        pyramid_levels: int = 1,
+        threshold: Optional[float] = None,
+    ) -> Tuple[float, tuple]:
+        """
+        縮小画像で大まかな位置を探索したあと、その周辺のみ元の解像度で探索する
+        縮小率は1/2**pyramid_levels(大きいほど高速だが、小さい特徴を見落としやすくなる)
+        縮小後のテンプレート画像が小さくなりすぎる場合は段数を自動で減らす
+        縮小画像で類似度が高い順にpyramid_candidates個の候補位置を元の解像度で確認し、
+        thresholdを指定した場合は、いずれの候補も閾値を超えなければ画像全体を元の解像度で探索する
+        """
+        height, width = template_image.shape[0], template_image.shape[1]
+        while pyramid_levels > 0 and min(height, width) >> pyramid_levels < self.pyramid_min_template_size:
+            pyramid_levels -= 1
+        if pyramid_levels <= 0:
+            return self.doTemplateMatch(image, template_image, mask_image=mask_image)
+
+        # 縮小画像で探索する
+        scale = 2**pyramid_levels
+        small_image = cv2.resize(
+            image, (image.shape[1] // scale, image.shape[0] // scale), interpolation=cv2.INTER_AREA
+        )
+        small_template = cv2.resize(template_image, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+        small_mask = (
+            cv2.resize(mask_image, (width // scale, height // scale), interpolation=cv2.INTER_NEAREST)
+            if isinstance(mask_image, ndarray)
+            else None
+        )
+        method = cv2.TM_CCORR_NORMED if isinstance(small_mask, ndarray) else cv2.TM_CCOEFF_NORMED
+        res = self.__backend.match(
+            small_image,
+            small_template,
+            method,
+            mask_image=small_mask,
+            result=self.getResultBuffer(small_image, small_template),
+        )
+
+        # 類似度が高い順に候補位置を取り出す(元の解像度で確認する範囲は次の候補から除外する)
+        coarse_locs = []
+        suppress = self.pyramid_margin
+        for _ in range(self.pyramid_candidates):
+            _, coarse_val, _, coarse_loc = cv2.minMaxLoc(res)
+            if coarse_locs and not coarse_val > -1.0:
+                break
+            coarse_locs.append(coarse_loc)
+            res[
+                max(0, coarse_loc[1] - suppress) : coarse_loc[1] + suppress + 1,
+                max(0, coarse_loc[0] - suppress) : coarse_loc[0] + suppress + 1,
+            ] = -1.0
+
+        # 候補位置の周辺のみ元の解像度で探索する
+        # (テンプレート画像の位置が縮小率の倍数でない場合は縮小画像上の位置が数pxずれるため、その分を含める)
+        margin = scale * self.pyramid_margin
+        best_val, best_loc = -1.0, (0, 0)
+        for coarse_loc in coarse_locs:
+            x_start = max(0, coarse_loc[0] * scale - margin)
+            y_start = max(0, coarse_loc[1] * scale - margin)
+            x_end = min(image.shape[1], coarse_loc[0] * scale + width + margin)
+            y_end = min(image.shape[0], coarse_loc[1] * scale + height + margin)
+            max_val, max_loc = self.doTemplateMatch(
+                image[y_start:y_end, x_start:x_end], template_image, mask_image=mask_image
+            )
+            if max_val > best_val:
+                best_val, best_loc = max_val, (max_loc[0] + x_start, max_loc[1] + y_start)
+
+        if threshold is not None and not best_val > threshold:
+            # 縮小画像で見落とした可能性があるため、画像全体を探索する
+            return self.doTemplateMatch(image, template_image, mask_image=mask_image)
+
+        return best_val, best_loc
+
+    def doTemplateMatchEarlyExit(
+        self,
+        image: ndarray,
+        template_image: ndarray,
+        mask_image: ndarray = None,
+        threshold: float = 0.7,
+        hint_loc: Optional[tuple] = None,
+    ) -> Tuple[float, tuple]:
+        """
+        探索範囲をタイル状に分割して順番にテンプレートマッチングを行い、類似度が閾値を超えた時点で終了する
+        hint_locを指定した場合は、その位置に近いタイルから順に探索する(前回の検出位置などを指定する)
+        閾値を超えた場合の類似度と位置は最初に閾値を超えたタイル内の最大値であり、画像全体の最大値とは限らない
+        閾値を超えなかった場合は画像全体を探索した場合と同じ結果になる
+        """
+        height, width = template_image.shape[0], template_image.shape[1]
+        res_height = image.shape[0] - height + 1
+        res_width = image.shape[1] - width + 1
+        tile = self.early_exit_tile_size
+        if res_height <= tile and res_width <= tile:
+            return self.doTemplateMatch(image, template_image, mask_image=mask_image)
+
+        # 探索位置の範囲をタイルに分割する
+        tiles = [
+            (y, min(y + tile, res_height), x, min(x + tile, res_width))
+            for y in range(0, res_height, tile)
+            for x in range(0, res_width, tile)
+        ]
+        if hint_loc is not None:
+            tiles.sort(
+                key=lambda t: (
+                    max(t[2] - hint_loc[0], 0, hint_loc[0] - t[3] + 1) ** 2
+                    + max(t[0] - hint_loc[1], 0, hint_loc[1] - t[1] + 1) ** 2
+                )
+            )
+
+        best_val, best_loc = -1.0, (0, 0)
+        for y_start, y_end, x_start, x_end in tiles:
+            max_val, max_loc = self.doTemplateMatch(
+                image[y_start : y_end + height - 1, x_start : x_end + width - 1], template_image, mask_image=mask_image
+            )
+            if max_val > best_val:
+                best_val, best_loc = max_val, (max_loc[0] + x_start, max_loc[1] + y_start)
+            if best_val > threshold:
+                break
+
+        return best_val, best_loc
+
     def isContainTemplate(
         self,
         image: ndarray,
@@ -236,13 +1018,28 @@ class ImageProcessing:
         threshold_binary: Optional[int] = None,
         crop_template: list[int] = [],
         show_image: bool = False,
+        is_template_preprocessed: bool = False,
+        frame_cache: Optional[FrameCache] = None,
+        pyramid_levels: int = 0,
+        early_exit: bool = False,
+        search_hint: Optional[tuple] = None,
     ) -> Tuple[bool, tuple, int, int, float]:
         """
         テンプレートマッチングを行い類似度が閾値を超えているかを確認する
+        is_template_preprocessedがTrueの場合、テンプレート画像は前処理済みとして扱う(TemplateCache使用時)
+        frame_cacheにimageを設定済みのFrameCacheを渡すと、imageの前処理結果を再利用する
+        pyramid_levelsを1以上にすると縮小画像による粗密探索を行う(doTemplateMatchPyramid)
+        early_exitをTrueにすると閾値を超えた時点で探索を打ち切る(doTemplateMatchEarlyExit、pyramid_levelsより優先)
+        search_hintはearly_exit時に優先して探索する位置(トリミング後の画像上の座標)
         """
         # テンプレートマッチング対象画像を加工する
-        src, _, _ = doPreprocessImage(
-            image, use_gray=use_gray, crop=crop, BGR_range=BGR_range, threshold_binary=threshold_binary
+        src, _, _ = self.preprocessImage(
+            image,
+            use_gray=use_gray,
+            crop=crop,
+            BGR_range=BGR_range,
+            threshold_binary=threshold_binary,
+            frame_cache=frame_cache,
         )
 
         # [DEBUG] テンプレートマッチング対象画像を表示する
@@ -251,16 +1048,26 @@ class ImageProcessing:
             cv2.waitKey()
 
         # テンプレート画像を加工する
-        template, width, height = doPreprocessImage(
-            template_image,
-            use_gray=use_gray,
-            crop=crop_template,
-            BGR_range=BGR_range,
-            threshold_binary=threshold_binary,
-        )
+        if is_template_preprocessed:
+            template, width, height = template_image, template_image.shape[1], template_image.shape[0]
+        else:
+            template, width, height = doPreprocessImage(
+                template_image,
+                use_gray=use_gray,
+                crop=crop_template,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+            )
 
         # テンプレートマッチングを行う
-        max_val, max_loc = self.doTemplateMatch(src, template, mask_image=mask_image)
+        if early_exit:
+            max_val, max_loc = self.doTemplateMatchEarlyExit(
+                src, template, mask_image=mask_image, threshold=threshold, hint_loc=search_hint
+            )
+        else:
+            max_val, max_loc = self.doTemplateMatch(
+                src, template, mask_image=mask_image, pyramid_levels=pyramid_levels, threshold=threshold
+            )
 
         # 類似度が閾値を超えたかを戻り値として返す(合わせて位置とテンプレート画像のサイズも返す)
         return max_val > threshold, max_loc, width, height, max_val
@@ -277,6 +1084,9 @@ class ImageProcessing:
         threshold_binary: Optional[int] = None,
         crop_template: list[int] = [],
         show_image: bool = False,
+        is_template_preprocessed: bool = False,
+        frame_cache: Optional[FrameCache] = None,
+        pyramid_levels: int = 0,
     ) -> Tuple[int, List[float], List[tuple], List[int], List[int], List[bool]]:
         """
         複数のテンプレート画像を用いてそれぞれテンプレートマッチングを行い類似度が最も大きい画像のindexを返す
@@ -298,8 +1108,13 @@ class ImageProcessing:
         judge_threshold_list = []
 
         # テンプレートマッチング対象画像を加工する
-        src, _, _ = doPreprocessImage(
-            image, use_gray=use_gray, crop=crop, BGR_range=BGR_range, threshold_binary=threshold_binary
+        src, _, _ = self.preprocessImage(
+            image,
+            use_gray=use_gray,
+            crop=crop,
+            BGR_range=BGR_range,
+            threshold_binary=threshold_binary,
+            frame_cache=frame_cache,
         )
 
         # [DEBUG] テンプレートマッチング対象画像を表示する
@@ -309,14 +1124,19 @@ class ImageProcessing:
 
         for template_image, mask_image in zip(template_image_list, mask_image_list_temp):
             # テンプレート画像を加工する
-            template, width, height = doPreprocessImage(
-                template_image,
-                use_gray=use_gray,
-                crop=crop_template,
-                BGR_range=BGR_range,
-                threshold_binary=threshold_binary,
+            if is_template_preprocessed:
+                template, width, height = template_image, template_image.shape[1], template_image.shape[0]
+            else:
+                template, width, height = doPreprocessImage(
+                    template_image,
+                    use_gray=use_gray,
+                    crop=crop_template,
+                    BGR_range=BGR_range,
+                    threshold_binary=threshold_binary,
+                )
+            max_val, max_loc = self.doTemplateMatch(
+                src, template, mask_image=mask_image, pyramid_levels=pyramid_levels, threshold=threshold
             )
-            max_val, max_loc = self.doTemplateMatch(src, template, mask_image=mask_image)
             max_val_list.append(max_val)
             max_loc_list.append(max_loc)
             width_list.append(width)
@@ -325,6 +1145,90 @@ class ImageProcessing:
 
         return argmax(max_val_list), max_val_list, max_loc_list, width_list, height_list, judge_threshold_list
 
+    def isContainTemplate_batch(
+        self,
+        image: ndarray,
+        request_list: List[dict],
+        use_gray: bool = True,
+        BGR_range: Optional[dict] = None,
+        threshold_binary: Optional[int] = None,
+        is_template_preprocessed: bool = False,
+        frame_cache: Optional[FrameCache] = None,
+    ) -> ndarray:
+        """
+        複数のテンプレート画像について、それぞれの探索範囲と閾値でテンプレートマッチングを行う
+        request_listの各要素は以下のキーを持つdict(template以外は省略可、cropとcrop_templateはopencv形式)
+            template, mask, threshold, crop(探索範囲), crop_template, use_gray, BGR_range, threshold_binary
+        use_gray/BGR_range/threshold_binaryが省略された要素には引数の値を使用する。
+        対象画像の前処理は同じ前処理の要素ごとに1回だけ行い、マッチングはスレッドプールで並列に実行する。
+        戻り値はMATCH_RESULT_DTYPEの配列(request_listと同じ順番)
+        """
+        result = zeros(len(request_list), dtype=MATCH_RESULT_DTYPE)
+        if len(request_list) == 0:
+            return result
+
+        if frame_cache is None or not frame_cache.isBound(image):
+            frame_cache = FrameCache()
+            frame_cache.bind(image)
+
+        # 対象画像の前処理が同じものごとにまとめる
+        groups = {}
+        for i, request in enumerate(request_list):
+            params = (
+                request.get("use_gray", use_gray),
+                request.get("BGR_range", BGR_range),
+                request.get("threshold_binary", threshold_binary),
+            )
+            key = (params[0], _freeze_BGR_range(params[1]), params[2])
+            groups.setdefault(key, (params, []))[1].append(i)
+
+        # 前処理はFrameCacheを使って呼び出し元のスレッドで行う
+        jobs = []
+        for params, index_list in groups.values():
+            _use_gray, _BGR_range, _threshold_binary = params
+            if len(index_list) > 1:
+                # 複数の要素で使う場合は画像全体を1回だけ処理し、各要素ではトリミングのみ行う
+                frame_cache.preprocess(use_gray=_use_gray, BGR_range=_BGR_range, threshold_binary=_threshold_binary)
+            for i in index_list:
+                request = request_list[i]
+                crop = request.get("crop", [])
+                src, _, _ = frame_cache.preprocess(
+                    use_gray=_use_gray, crop=crop, BGR_range=_BGR_range, threshold_binary=_threshold_binary
+                )
+                if is_template_preprocessed:
+                    template = request["template"]
+                else:
+                    template, _, _ = doPreprocessImage(
+                        request["template"],
+                        use_gray=_use_gray,
+                        crop=request.get("crop_template", []),
+                        BGR_range=_BGR_range,
+                        threshold_binary=_threshold_binary,
+                    )
+                offset = (crop[2], crop[0]) if crop else (0, 0)
+                jobs.append((i, src, template, request.get("mask"), request.get("threshold", 0.7), offset))
+
+        def match(job):
+            i, src, template, mask, threshold, offset = job
+            max_val, max_loc = self.doTemplateMatch(src, template, mask_image=mask)
+            result[i] = (
+                max_val,
+                max_loc[0] + offset[0],
+                max_loc[1] + offset[1],
+                template.shape[1],
+                template.shape[0],
+                max_val > threshold,
+            )
+
+        if len(jobs) > 1 and not self.__use_gpu:
+            # 例外が発生した場合はここで呼び出し元に送出される
+            list(getMatchExecutor().map(match, jobs))
+        else:
+            for job in jobs:
+                match(job)
+
+        return result
+
     def saveImage(self, image: ndarray, filename: str = None, crop: List[int] = None):
         """
         画像を保存する。
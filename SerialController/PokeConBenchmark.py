@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画像認識処理・入力の送信データ作成のベンチマーク
+カメラ・マイコンを使用せず、保存済みのフレーム画像とテンプレート画像で処理時間を計測し、結果をJSONで出力する
+
+使い方:
+    python PokeConBenchmark.py match [--frames フレーム画像のフォルダ] [--templates テンプレート画像のフォルダ]
+    python PokeConBenchmark.py alloc
+    python PokeConBenchmark.py keys
+    python PokeConBenchmark.py preview
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+import cv2
+import numpy
+from numpy import ndarray, random
+from PIL import Image
+
+from Commands.Keys import (
+    Button,
+    Direction,
+    Hat,
+    KeyPress,
+    encode3DSController,
+    encodeDefault,
+    encodeQingpi,
+)
+from ImageProcessing import (
+    FrameCache,
+    ImageProcessing,
+    compileROI,
+    crop_image,
+    doPreprocessImage,
+    getImage,
+)
+from PreviewRenderer import resizePreviewImage
+
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Template", "Samples")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# 計測する前処理の組み合わせ(ImageProcessing.isContainTemplateの引数)
+MATCH_VARIANTS = {
+    "gray": {"use_gray": True},
+    "color": {"use_gray": False},
+    "mask": {"use_gray": True, "use_mask": True},
+    "BGR_range": {"use_gray": False, "BGR_range": {"lower": [0, 0, 0], "upper": [200, 200, 200]}},
+    "threshold_binary": {"use_gray": True, "threshold_binary": 128},
+    "max": {"use_gray": True, "use_max": True},
+}
+
+# この大きさ(byte)以上のメモリ確保が発生した呼び出しを「メモリ確保あり」として数える
+ALLOCATION_THRESHOLD = 1024
+
+
+def makeRandomFrame(width: int = 1280, height: int = 720, seed: int = 0) -> ndarray:
+    """
+    ベンチマーク用のランダムなフレーム(BGR)を作成する
+    """
+    return random.default_rng(seed).integers(0, 256, (height, width, 3), dtype="uint8")
+
+
+def measureAllocations(func: Callable[[], object], iterations: int = 100) -> dict:
+    """
+    funcをiterations回呼び出し、1回の呼び出しごとに確保されたメモリ量をtracemallocで計測する
+    tracemallocのピーク値から計測するため、呼び出し中に確保して解放したメモリも含まれる
+    """
+    func()  # 初回のバッファ確保などを除外する
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    allocating_calls = 0
+    total_bytes = 0
+    max_bytes = 0
+    try:
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            allocated = max(peak - before, 0)
+            total_bytes += allocated
+            max_bytes = max(max_bytes, allocated)
+            if allocated >= ALLOCATION_THRESHOLD:
+                allocating_calls += 1
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return {
+        "iterations": iterations,
+        "allocating_calls": allocating_calls,
+        "bytes_per_call": total_bytes / iterations,
+        "max_bytes": max_bytes,
+    }
+
+
+def loadImages(path: str) -> List[tuple]:
+    """
+    フォルダ内の画像を名前順に読み込む
+    """
+    files = sorted(f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(IMAGE_EXTENSIONS))
+    images = []
+    for f in files:
+        image = getImage(f, mode="color")
+        if image is not None:
+            images.append((os.path.basename(f), image))
+    return images
+
+
+def summarizeTimes(times_ns: List[int]) -> dict:
+    """
+    処理時間(ns)の一覧から統計値(ms)とスループットを計算する
+    """
+    times_ms = numpy.array(times_ns, dtype="float64") / 1e6
+    total_s = times_ms.sum() / 1000
+    return {
+        "count": len(times_ms),
+        "mean_ms": float(times_ms.mean()),
+        "min_ms": float(times_ms.min()),
+        "p50_ms": float(numpy.percentile(times_ms, 50)),
+        "p95_ms": float(numpy.percentile(times_ms, 95)),
+        "p99_ms": float(numpy.percentile(times_ms, 99)),
+        "max_ms": float(times_ms.max()),
+        "throughput_per_s": len(times_ms) / total_s if total_s > 0 else None,
+    }
+
+
+def getEnvironment() -> dict:
+    """
+    計測環境の情報(結果の比較用)
+    """
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": numpy.__version__,
+    }
+
+
+def benchmarkTemplateMatching(
+    frame_dir: Optional[str] = None,
+    template_dir: str = DEFAULT_TEMPLATE_DIR,
+    variants: Optional[List[str]] = None,
+    iterations: int = 5,
+    warmup: int = 1,
+    threshold: float = 0.7,
+    backend: Optional[str] = None,
+) -> dict:
+    """
+    保存済みのフレーム画像に対してテンプレートマッチングの処理時間を計測する
+    frame_dirを省略した場合は、template_dir内のフレームと同じサイズ(1280x720)の画像をフレームとして使用する
+    各variantについて、全フレーム×全テンプレートの組み合わせをiterations回繰り返して計測する
+    (maxはフレームごとに全テンプレートに対してisContainTemplate_maxを1回呼び出す)
+    """
+    templates = loadImages(template_dir)
+    if frame_dir is not None:
+        frames = loadImages(frame_dir)
+    else:
+        frames = [(name, image) for name, image in templates if image.shape[:2] == (720, 1280)]
+    if not frames:
+        raise ValueError("No frame images found.")
+    frame_height, frame_width = frames[0][1].shape[:2]
+    templates = [
+        (name, image) for name, image in templates if image.shape[0] < frame_height and image.shape[1] < frame_width
+    ]
+    if not templates:
+        raise ValueError("No template images found.")
+
+    ImgProc = ImageProcessing(backend=backend)
+    results = {}
+    for variant in variants if variants is not None else MATCH_VARIANTS:
+        params = dict(MATCH_VARIANTS[variant])
+        use_mask = params.pop("use_mask", False)
+        use_max = params.pop("use_max", False)
+
+        # テンプレート画像の前処理は計測に含めない(TemplateCacheの使用時と同じ条件)
+        template_images = [doPreprocessImage(image, **params)[0] for _, image in templates]
+        mask_images = [
+            cv2.threshold(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+            if use_mask
+            else None
+            for _, image in templates
+        ]
+
+        def run(frame: ndarray) -> List[int]:
+            times = []
+            if use_max:
+                start = time.perf_counter_ns()
+                ImgProc.isContainTemplate_max(
+                    frame, template_images, threshold=threshold, is_template_preprocessed=True, **params
+                )
+                times.append(time.perf_counter_ns() - start)
+                return times
+            for template_image, mask_image in zip(template_images, mask_images):
+                start = time.perf_counter_ns()
+                ImgProc.isContainTemplate(
+                    frame,
+                    template_image,
+                    mask_image=mask_image,
+                    threshold=threshold,
+                    is_template_preprocessed=True,
+                    **params,
+                )
+                times.append(time.perf_counter_ns() - start)
+            return times
+
+        for _ in range(warmup):
+            run(frames[0][1])
+        times_ns = []
+        for _ in range(iterations):
+            for _, frame in frames:
+                times_ns.extend(run(frame))
+        results[variant] = summarizeTimes(times_ns)
+
+    return {
+        "environment": getEnvironment(),
+        "backend": ImgProc.backend.name,
+        "frames": [name for name, _ in frames],
+        "templates": [name for name, _ in templates],
+        "iterations": iterations,
+        "threshold": threshold,
+        "results": results,
+    }
+
+
+def benchmarkPreprocessAllocations(
+    image: ndarray = None,
+    crop_fmt: int | str = 1,
+    crop: List[int] = [400, 200, 880, 520],
+    use_gray: bool = True,
+    threshold_binary: int = None,
+    iterations: int = 100,
+) -> dict:
+    """
+    トリミング・前処理1回あたりのメモリ確保量を比較する
+    ・per_call: 呼び出しごとにトリミング範囲を変換してdoPreprocessImageで処理する(従来の方法)
+    ・roi: compileROIで変換済みのROIのバッファに書き込む
+    ・frame_cache: 毎フレームFrameCacheを設定し直して処理する(ImageProcPythonCommandでの処理)
+    """
+    if image is None:
+        image = makeRandomFrame()
+    crop_cv2 = list(compileROI(crop_fmt, crop).cv2)
+
+    def per_call():
+        doPreprocessImage(
+            crop_image(image, crop=crop_cv2),
+            use_gray=use_gray,
+            threshold_binary=threshold_binary,
+        )
+
+    def roi():
+        compileROI(crop_fmt, crop).preprocess(image, use_gray=use_gray, threshold_binary=threshold_binary)
+
+    frame_cache = FrameCache()
+    seq = [0]
+
+    def frame_cache_preprocess():
+        seq[0] += 1
+        frame_cache.bind(image, seq[0])
+        frame_cache.preprocess(use_gray=use_gray, crop=crop_cv2, threshold_binary=threshold_binary)
+
+    return {
+        "image_shape": list(image.shape),
+        "crop_cv2": crop_cv2,
+        "per_call": measureAllocations(per_call, iterations),
+        "roi": measureAllocations(roi, iterations),
+        "frame_cache": measureAllocations(frame_cache_preprocess, iterations),
+    }
+
+
+class _NullSender:
+    """
+    送信データを破棄するSender互換のオブジェクト(送信データの作成時間のみを計測する)
+    """
+
+    def writeRow(self, row: str, is_show: bool = False):
+        pass
+
+    def writeRow_wo_perf_counter(self, row: str, is_show: bool = False):
+        pass
+
+    def writeList(self, values: list, is_show: bool = False):
+        pass
+
+
+def benchmarkKeyEncoding(iterations: int = 5000, repeat: int = 5) -> dict:
+    """
+    KeyPress.input/inputEndの1回の入力(押して離す)あたりの処理時間(us)を送信データの形式ごとに計測する
+    encode_usはキャッシュ済みの送信データの作成、encode_uncached_usはキャッシュを使用しない場合の作成時間
+    """
+    inputs = [Button.A, [Button.B, Hat.TOP], Direction.UP, [Button.X, Direction.R_LEFT]]
+    encoders = {
+        "Default": lambda encode: encode(0x4, 8, (128, 0), None),
+        "Qingpi": lambda encode: encode(0x4, 8, 128, 0, 0, 0),
+        "3DS Controller": lambda encode: encode(0x4, 8, 128, 0),
+    }
+    encode_funcs = {"Default": encodeDefault, "Qingpi": encodeQingpi, "3DS Controller": encode3DSController}
+
+    def best_us(func: Callable[[], object]) -> float:
+        # 最も速かった回の1回あたりの時間(他の処理による遅れを除外する)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            for _ in range(iterations):
+                func()
+            elapsed = (time.perf_counter_ns() - start) / iterations / 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    results = {}
+    for name, encoder in encoders.items():
+        keys = KeyPress(_NullSender())
+        keys.serial_data_format_name = name
+        index = [0]
+
+        def press():
+            btns = inputs[index[0] % len(inputs)]
+            btns = list(btns) if isinstance(btns, list) else btns
+            keys.input(btns)
+            keys.inputEnd(btns)
+            index[0] += 1
+
+        encode = encode_funcs[name]
+        results[name] = {
+            "press_us": best_us(press),
+            "encode_us": best_us(lambda: encoder(encode)),
+            "encode_uncached_us": best_us(lambda: encoder(encode.__wrapped__)),
+        }
+
+    return {
+        "environment": getEnvironment(),
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def benchmarkPreviewConversion(iterations: int = 200, show_size: tuple = (640, 360)) -> dict:
+    """
+    プレビュー1フレームあたりの画像の変換時間(ms)を計測する(PhotoImageへの転送は含まない)
+    pil_resizeは従来のcvtColor→Image.fromarray→PILのresize、cv2_resizeはresizePreviewImage
+    """
+    frame = makeRandomFrame()
+
+    def pil_resize():
+        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return Image.fromarray(image_rgb).resize(show_size)
+
+    buffer = [None]
+
+    def cv2_resize():
+        image, buffer[0] = resizePreviewImage(frame, show_size, buffer[0])
+        return image
+
+    results = {}
+    for name, func in [("pil_resize", pil_resize), ("cv2_resize", cv2_resize)]:
+        func()
+        times_ns = []
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            func()
+            times_ns.append(time.perf_counter_ns() - start)
+        results[name] = summarizeTimes(times_ns)
+
+    return {
+        "environment": getEnvironment(),
+        "iterations": iterations,
+        "frame_size": [frame.shape[1], frame.shape[0]],
+        "show_size": list(show_size),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PokeCon image processing benchmark")
+    parser.add_argument(
+        "mode",
+        choices=["match", "alloc", "keys", "preview"],
+        help="match: template matching latency / alloc: allocation count of the preprocessing pipeline"
+        " / keys: serial packet encoding time per key press / preview: preview image conversion time per frame",
+    )
+    parser.add_argument("--iterations", "-n", type=int, default=None)
+    parser.add_argument("--frames", type=str, default=None, help="directory of captured frames")
+    parser.add_argument("--templates", type=str, default=DEFAULT_TEMPLATE_DIR, help="directory of template images")
+    parser.add_argument("--variants", nargs="+", choices=list(MATCH_VARIANTS), default=None)
+    parser.add_argument("--backend", type=str, default=None, help="cpu / opencl / cuda")
+    parser.add_argument("--output", "-o", type=str, default=None, help="write the result to this JSON file")
+    args = parser.parse_args()
+
+    if args.mode == "match":
+        result = benchmarkTemplateMatching(
+            frame_dir=args.frames,
+            template_dir=args.templates,
+            variants=args.variants,
+            iterations=args.iterations or 5,
+            backend=args.backend,
+        )
+    elif args.mode == "alloc":
+        result = benchmarkPreprocessAllocations(iterations=args.iterations or 100)
+    elif args.mode == "keys":
+        result = benchmarkKeyEncoding(iterations=args.iterations or 5000)
+    else:
+        result = benchmarkPreviewConversion(iterations=args.iterations or 200)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-import tkinter as tk
-import tkinter.ttk as ttk
+try:
+    import tkinter as tk
+    import tkinter.ttk as ttk
+
+    flag_import_tkinter = True
+except ImportError:
+    flag_import_tkinter = False
 import json
 import os
 import glob
@@ -242,6 +247,31 @@ class PokeConDialogue(object):
         self.isOK = False
 
 
+def get_initial_values(message: int | str | list, mode: int = 0, need: type = list) -> list | dict:
+    """
+    ダイアログを表示せずに各widgetの初期値を返す(GUIを使用しない場合にダイアログの代わりに使用する)
+    戻り値の形式はPokeConDialogue.ret_valueでOKを選択した場合と同じ
+    """
+    values = {}
+    if mode == 0:
+        for name in message if type(message) is list else [message]:
+            values[name] = ""
+    else:
+        for widget in message:
+            widget_type = widget[0].casefold()
+            if widget_type == "next":
+                continue
+            if widget_type in ["check", "entry"]:
+                values[widget[1]] = bool(widget[2]) if widget_type == "check" else str(widget[2])
+            elif widget_type in ["combo", "radio", "spin"]:
+                values[widget[1]] = str(widget[3])
+            elif widget_type == "scale":
+                values[widget[1]] = round(float(widget[4]), widget[5]) if widget[5] != 0 else int(widget[4])
+    if need is dict:
+        return values
+    return list(values.values())
+
+
 def check_widget_name(dialogue_list: list, except_name: list = []) -> bool:
     """
     ウィジェットに同一名称がないかを確認
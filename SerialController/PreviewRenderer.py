@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+プレビュー(CaptureArea)に表示する画像を作成するスレッド
+
+フレームの縮小と色の並べ替え(BGR→RGB)をメインスレッド以外で行い、メインスレッドは作成済みの画像を
+PhotoImageへ貼り付ける(paste)だけにする。
+メインスレッドが前の画像を取り出すまで次の画像は作成しないため、表示が追いつかない場合はその間のフレームを飛ばす。
+
+    renderer = PreviewRenderer(camera)
+    renderer.start()
+    # メインスレッドで定期的に呼び出す
+    ready, image = renderer.takeImage()
+    if ready:
+        photo.paste(image)
+    renderer.request((640, 360))
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from logging import getLogger, DEBUG, NullHandler
+from typing import Optional, Tuple
+
+import cv2
+import numpy
+from PIL import Image
+
+logger = getLogger(__name__)
+logger.addHandler(NullHandler())
+logger.setLevel(DEBUG)
+logger.propagate = True
+
+
+def resizePreviewImage(
+    frame: numpy.ndarray, size: Tuple[int, int], buffer: Optional[numpy.ndarray] = None
+) -> Tuple[Image.Image, numpy.ndarray]:
+    """
+    フレーム(BGR)をsize(幅, 高さ)に縮小したPILの画像(RGB)と、縮小に使用したバッファを返す
+    縮小はbufferに書き込み(大きさが同じ場合は使い回す)、BGR→RGBの並べ替えはPILの画像にコピーするときに同時に行う
+    """
+    width, height = size
+    if buffer is None or buffer.shape != (height, width, 3):
+        buffer = numpy.empty((height, width, 3), dtype=numpy.uint8)
+    cv2.resize(frame, (width, height), dst=buffer, interpolation=cv2.INTER_AREA)
+    return Image.frombuffer("RGB", (width, height), buffer, "raw", "BGR", 0, 1), buffer
+
+
+class PreviewRenderer:
+    """
+    カメラから最新のフレームを読み込み、プレビューの大きさのPILの画像を作成するスレッド
+    表示したフレーム数(rendered)と表示せずに飛ばしたフレーム数(dropped)を計測する
+    """
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.show_size = (640, 360)
+        self.read_timeout = 0.1  # 新しいフレームを待つ最大時間(s)
+        self._buffer = None
+        self._request = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        # 作成済みでメインスレッドが取り出していない画像(Noneはカメラから読み込めなかったことを表す)
+        self._pending = None
+        self._has_pending = False
+        self._pending_skipped = 0
+        self._last_seq = 0
+        self.resetStats()
+
+    def resetStats(self):
+        """
+        統計をリセットする
+        """
+        with self._lock:
+            self.rendered = 0
+            self.dropped = 0
+            self.render_time = 0.0
+            self.render_count = 0
+            self.stats_start = time.perf_counter()
+
+    def start(self):
+        """
+        画像を作成するスレッドを起動する
+        """
+        if self.isRunning():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="PreviewRenderer", daemon=True)
+        self._thread.start()
+        logger.debug("Preview renderer started")
+
+    def stop(self, timeout: float = 1.0):
+        """
+        画像を作成するスレッドを停止する
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._request.set()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        logger.debug("Preview renderer stopped")
+
+    def isRunning(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def request(self, show_size: Tuple[int, int]):
+        """
+        次の画像の作成を要求する(作成中の場合は作成後にもう一度作成する)
+        """
+        self.show_size = (int(show_size[0]), int(show_size[1]))
+        self._request.set()
+
+    def takeImage(self) -> Tuple[bool, Optional[Image.Image]]:
+        """
+        作成済みの画像を取り出す(メインスレッドから呼び出す)
+        新しい画像がない場合は(False, None)、カメラから読み込めなかった場合は(True, None)を返す
+        """
+        with self._lock:
+            if not self._has_pending:
+                return False, None
+            image = self._pending
+            self._pending = None
+            self._has_pending = False
+            if image is not None:
+                self.rendered += 1
+                self.dropped += self._pending_skipped
+            self._pending_skipped = 0
+            return True, image
+
+    def getStats(self) -> dict:
+        """
+        表示したフレーム数・飛ばしたフレーム数・表示のfps・1フレームの作成時間(ms)の平均
+        """
+        with self._lock:
+            elapsed = time.perf_counter() - self.stats_start
+            return {
+                "rendered": self.rendered,
+                "dropped": self.dropped,
+                "fps": self.rendered / elapsed if elapsed > 0 else 0.0,
+                "mean_render_ms": self.render_time / self.render_count * 1000 if self.render_count else 0.0,
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._request.wait()
+            self._request.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self._render()
+            except Exception as e:
+                # カメラの切り替え中などに読み込みに失敗してもスレッドは止めない
+                logger.debug(f"Preview rendering failed: {type(e).__name__}: {e}")
+                self._post(None, self._last_seq)
+
+    def _render(self):
+        frame, seq, _ = self.camera.readFrameWithSeq(min_seq=self._last_seq + 1, timeout=self.read_timeout)
+        if frame is None:
+            self._post(None, seq)
+            return
+        if seq <= self._last_seq:
+            # 新しいフレームがまだ届いていない
+            return
+
+        start = time.perf_counter()
+        image, self._buffer = resizePreviewImage(frame, self.show_size, self._buffer)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.render_time += elapsed
+            self.render_count += 1
+        self._post(image, seq)
+
+    def _post(self, image: Optional[Image.Image], seq: int):
+        with self._lock:
+            # 前回表示したフレームから今回のフレームまでの間に届いたフレームは表示されない
+            skipped = max(seq - self._last_seq - 1, 0) if image is not None and self._last_seq else 0
+            if self._has_pending and self._pending is not None:
+                # 取り出されずに上書きされる画像も表示されない
+                skipped += 1
+            self._pending = image
+            self._has_pending = True
+            self._pending_skipped += skipped
+            self._last_seq = seq
@@ -4,14 +4,20 @@ from __future__ import annotations
 
 import configparser
 import os
-import tkinter as tk
 from logging import getLogger  # , DEBUG, NullHandler
 
+import TkStandIn
+
 
 class GuiSettings:
     SETTING_PATH = os.path.join(os.path.dirname(__file__), "profiles", "default", "settings.ini")
 
-    def __init__(self):
+    def __init__(self, setting_path: str = None):
+        # setting_pathを指定した場合はそのファイルを使用する(複数のプロファイルを同時に読み込む場合など)
+        if setting_path is not None:
+            self.SETTING_PATH = setting_path
+        # tkinterが使用できない場合(GUIを使用しない場合)はtkinterの変数の代わりにTkStandInの変数を使用する
+        tk = TkStandIn.getVariableModule()
         self._logger = getLogger(__name__)
         self.setting = configparser.ConfigParser()
         self.setting.optionxform = str
@@ -45,6 +51,28 @@ class GuiSettings:
             )
         except Exception:
             self.serial_data_format_name = tk.StringVar(value="Default")
+        try:
+            self.is_use_frame_grabber = tk.BooleanVar(
+                value=self.setting["General Setting"].getboolean("is_use_frame_grabber")
+            )
+        except Exception:
+            self.is_use_frame_grabber = tk.BooleanVar(value=False)
+        try:
+            self.template_match_backend = tk.StringVar(value=self.setting["General Setting"]["template_match_backend"])
+        except Exception:
+            self.template_match_backend = tk.StringVar(value="cpu")
+        try:
+            self.is_use_serial_writer = tk.BooleanVar(
+                value=self.setting["General Setting"].getboolean("is_use_serial_writer")
+            )
+        except Exception:
+            self.is_use_serial_writer = tk.BooleanVar(value=False)
+        try:
+            self.is_coalesce_serial_write = tk.BooleanVar(
+                value=self.setting["General Setting"].getboolean("is_coalesce_serial_write")
+            )
+        except Exception:
+            self.is_coalesce_serial_write = tk.BooleanVar(value=False)
         try:
             self.touchscreen_start_x = int(self.setting["General Setting"]["touchscreen_start_x"])
         except Exception:
@@ -147,6 +175,10 @@ class GuiSettings:
             "is_show_serial": False,
             "is_use_keyboard": True,
             "serial_data_format_name": "Default",
+            "is_use_frame_grabber": False,
+            "template_match_backend": "cpu",
+            "is_use_serial_writer": False,
+            "is_coalesce_serial_write": False,
             "touchscreen_start_x": 1,
             "touchscreen_start_y": 1,
             "touchscreen_end_x": 320,
@@ -252,6 +284,10 @@ class GuiSettings:
             "is_show_serial": self.is_show_serial.get(),
             "is_use_keyboard": self.is_use_keyboard.get(),
             "serial_data_format_name": self.serial_data_format_name.get(),
+            "is_use_frame_grabber": self.is_use_frame_grabber.get(),
+            "template_match_backend": self.template_match_backend.get(),
+            "is_use_serial_writer": self.is_use_serial_writer.get(),
+            "is_coalesce_serial_write": self.is_coalesce_serial_write.get(),
             "touchscreen_start_x": self.touchscreen_start_x,
             "touchscreen_start_y": self.touchscreen_start_y,
             "touchscreen_end_x": self.touchscreen_end_x,
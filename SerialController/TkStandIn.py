@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tkinterを使用せずに動作させる場合(HeadlessRunnerなど)のtkinterの代わり
+tkinterがインストールされていない場合や、ルートウィンドウがない場合はtk.BooleanVarなどの代わりにこのモジュールの変数を使用する。
+
+    tk = TkStandIn.getVariableModule()
+    is_show_serial = tk.BooleanVar(value=False)
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import Any, Callable
+
+try:
+    import tkinter
+
+    flag_import_tkinter = True
+except ImportError:
+    flag_import_tkinter = False
+
+
+def isTkAvailable() -> bool:
+    """
+    tkinterのウィンドウ・変数を作成できる(tkinterがインストールされていて、ルートウィンドウがある)かどうか
+    """
+    return flag_import_tkinter and getattr(tkinter, "_default_root", None) is not None
+
+
+def getVariableModule():
+    """
+    tkinterが使用できる場合はtkinter、使用できない場合はこのモジュールを返す(どちらもBooleanVarなどを持つ)
+    """
+    if isTkAvailable():
+        return tkinter
+    return sys.modules[__name__]
+
+
+class Variable:
+    """
+    tkinter.Variableと同じように使用できる値の入れ物(get/set/trace_add)
+    """
+
+    _default: Any = ""
+
+    def __init__(self, master=None, value: Any = None, name: str = None):
+        self._value = self._default if value is None else value
+        self._callbacks = {}
+
+    def get(self) -> Any:
+        return self._value
+
+    def set(self, value: Any):
+        self._value = value
+        for mode, callback in list(self._callbacks.values()):
+            if mode in ("write", ("write",)):
+                callback(str(id(self)), "", "write")
+
+    def trace_add(self, mode: str, callback: Callable) -> str:
+        cbname = f"{id(callback)}{len(self._callbacks)}"
+        self._callbacks[cbname] = (mode, callback)
+        return cbname
+
+    def trace_remove(self, mode: str, cbname: str):
+        self._callbacks.pop(cbname, None)
+
+
+class StringVar(Variable):
+    _default = ""
+
+    def get(self) -> str:
+        return str(self._value)
+
+
+class IntVar(Variable):
+    _default = 0
+
+    def get(self) -> int:
+        return int(self._value)
+
+
+class DoubleVar(Variable):
+    _default = 0.0
+
+    def get(self) -> float:
+        return float(self._value)
+
+
+class BooleanVar(Variable):
+    _default = False
+
+    def get(self) -> bool:
+        value = self._value
+        if isinstance(value, str):
+            # tkinterと同様に文字列の"True"/"False"なども変換する
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+キャプチャボード・マイコンを使用せずにコマンドを実行するための仮想デバイス
+
+・FrameSourceCapture: 動画ファイルまたは画像フォルダからフレームを返すcv2.VideoCapture互換のカメラ
+・LoopbackSerial: 書き込まれたデータを時刻とともに記録するserial.Serial互換のシリアルポート
+・PtySerial: 疑似端末に書き込むLoopbackSerial(外部のプログラムから送信データを読み込める, POSIXのみ)
+"""
+
+from __future__ import annotations
+
+import csv
+import glob
+import os
+import threading
+from collections import OrderedDict, deque
+from logging import getLogger, DEBUG, NullHandler
+from typing import List, Optional, Tuple
+
+import cv2
+from numpy import ndarray
+
+from Clock import RealClock, default_clock
+from ImageProcessing import getImage
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+class FrameSourceCapture:
+    """
+    動画ファイルまたは画像フォルダ(ファイル名順)からフレームを読み込むcv2.VideoCapture互換のカメラ
+    readは実際のカメラと同様に設定されたfpsの間隔でフレームを返す。
+    speedを指定すると再生速度を変更できる(2.0で2倍速)。読み込みが遅れた場合は経過時間に応じてフレームを飛ばす。
+    clockにVirtualClockを指定すると、仮想的な時刻に応じたフレームを返す(次のフレームを待つ間は時刻を進める)。
+    """
+
+    frame_cache_size = 64  # 画像フォルダの場合に保持するデコード済みフレーム数
+
+    def __init__(
+        self, source: str, fps: float = 30, speed: float = 1.0, loop: bool = True, clock: RealClock = default_clock
+    ):
+        self._logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+
+        self.source = source
+        self.fps = float(fps)
+        self.speed = float(speed)
+        self.loop = loop
+        # フレームの間隔の待機はコマンドの待機と傾向が異なるため、別のPrecisionSleeperを使用する
+        self.clock = clock.fork()
+        self.__video = None
+        self.__video_pos = 0
+        self.__files = []
+        self.__frames = OrderedDict()
+        self.__start = None
+        self.__index = -1
+        self.__props = {}
+
+        if os.path.isdir(source):
+            self.__files = sorted(
+                f for f in glob.glob(os.path.join(source, "*")) if f.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            self.frame_count = len(self.__files)
+        else:
+            self.__video = cv2.VideoCapture(source)
+            self.frame_count = int(self.__video.get(cv2.CAP_PROP_FRAME_COUNT)) if self.__video.isOpened() else 0
+        if self.frame_count == 0:
+            self._logger.error(f"No frames found in {source}")
+
+    def isOpened(self) -> bool:
+        return self.frame_count > 0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        if prop_id == cv2.CAP_PROP_FPS and value > 0:
+            self.fps = float(value)
+        self.__props[prop_id] = value
+        return True
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return self.__index + 1
+        return self.__props.get(prop_id, 0)
+
+    def getFrameIndex(self) -> int:
+        """
+        最後に返したフレームの番号(ループした場合も通算の番号)
+        """
+        return self.__index
+
+    def read(self) -> Tuple[bool, Optional[ndarray]]:
+        if not self.isOpened():
+            return False, None
+        now = self.clock.now()
+        interval = 1.0 / (self.fps * self.speed)
+        if self.__start is None:
+            self.__start = now
+            index = 0
+        else:
+            index = int((now - self.__start) / interval)
+            if index <= self.__index:
+                # 次のフレームの時刻まで待つ
+                index = self.__index + 1
+                self.clock.sleepUntil(self.__start + index * interval)
+        frame = self.__getFrame(index)
+        if frame is None:
+            return False, None
+        self.__index = index
+        return True, frame
+
+    def __getFrame(self, index: int) -> Optional[ndarray]:
+        if index >= self.frame_count:
+            if not self.loop:
+                return None
+            index %= self.frame_count
+        if self.__video is not None:
+            return self.__readVideo(index)
+        frame = self.__frames.get(index)
+        if frame is None:
+            frame = getImage(self.__files[index], mode="color")
+            if frame is None:
+                return None
+            self.__frames[index] = frame
+            while len(self.__frames) > self.frame_cache_size:
+                self.__frames.popitem(last=False)
+        else:
+            self.__frames.move_to_end(index)
+        # 呼び出し側で書き換えられても良いようにコピーを返す
+        return frame.copy()
+
+    def __readVideo(self, index: int) -> Optional[ndarray]:
+        if index < self.__video_pos:
+            self.__video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.__video_pos = 0
+        # 飛ばすフレームはデコードしない
+        while self.__video_pos < index:
+            self.__video.grab()
+            self.__video_pos += 1
+        ret, frame = self.__video.read()
+        self.__video_pos += 1
+        return frame if ret else None
+
+    def release(self):
+        if self.__video is not None:
+            self.__video.release()
+        self.__frames.clear()
+        self.frame_count = 0
+
+
+class LoopbackSerial:
+    """
+    書き込まれたデータを送信時刻(clockの時刻)とともに記録するserial.Serial互換のシリアルポート
+    echo=Trueの場合は書き込まれたデータを読み込み側に折り返す
+    max_recordsを指定すると古い記録から破棄する
+    """
+
+    def __init__(self, echo: bool = False, max_records: Optional[int] = None, clock: RealClock = default_clock):
+        self.port = "loopback"
+        self.clock = clock
+        self.echo = echo
+        self.max_records = max_records
+        self.is_open = True
+        self.records = deque(maxlen=max_records)
+        self.write_count = 0
+        self.bytes_written = 0
+        self.first_write = None
+        self.last_write = None
+        self.__rx = bytearray()
+        self.__lock = threading.Lock()
+
+    def isOpen(self) -> bool:
+        return self.is_open
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data) -> int:
+        if not self.is_open:
+            raise IOError("Attempting to use a port that is not open")
+        data = bytes(data)
+        timestamp = self.clock.now()
+        with self.__lock:
+            self.records.append((timestamp, data))
+            self.write_count += 1
+            self.bytes_written += len(data)
+            if self.first_write is None:
+                self.first_write = timestamp
+            self.last_write = timestamp
+            if self.echo:
+                self.__rx.extend(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.__rx)
+
+    def read(self, size: int = 1) -> bytes:
+        with self.__lock:
+            data = bytes(self.__rx[:size])
+            del self.__rx[:size]
+        return data
+
+    def reset_input_buffer(self):
+        with self.__lock:
+            self.__rx.clear()
+
+    def getRows(self) -> List[Tuple[float, str]]:
+        """
+        記録したデータを(送信時刻, 文字列)の一覧で返す(Default/Qingpi形式の行は改行を除く)
+        バイナリ形式のデータは16進数の文字列で返す
+        """
+        with self.__lock:
+            records = list(self.records)
+        rows = []
+        for timestamp, data in records:
+            try:
+                rows.append((timestamp, data.decode("utf-8").rstrip("\r\n")))
+            except UnicodeDecodeError:
+                rows.append((timestamp, data.hex(" ")))
+        return rows
+
+    def getStats(self) -> dict:
+        """
+        書き込み回数、バイト数、書き込み期間(s)および1秒あたりの書き込み回数
+        """
+        with self.__lock:
+            duration = (self.last_write - self.first_write) if self.first_write is not None else 0.0
+            return {
+                "writes": self.write_count,
+                "bytes": self.bytes_written,
+                "duration": duration,
+                "writes_per_s": (self.write_count - 1) / duration if duration > 0 else None,
+            }
+
+    def dump(self, filename: str):
+        """
+        記録したデータをCSV(送信時刻, 前回からの間隔, データ)で保存する
+        """
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["timestamp", "interval", "data"])
+            before = None
+            for timestamp, row in self.getRows():
+                writer.writerow([f"{timestamp:.6f}", "" if before is None else f"{timestamp - before:.6f}", row])
+                before = timestamp
+
+
+class PtySerial(LoopbackSerial):
+    """
+    疑似端末(pty)に書き込むLoopbackSerial(POSIXのみ)
+    portに表示される端末を外部のプログラムで開くと、送信データをシリアルポートと同様に読み込める
+    """
+
+    def __init__(self, echo: bool = False, max_records: Optional[int] = None, clock: RealClock = default_clock):
+        super().__init__(echo=echo, max_records=max_records, clock=clock)
+        import tty
+
+        self.__master, self.__slave = os.openpty()
+        tty.setraw(self.__slave)
+        # 読み込み側がいない場合でも書き込みで止まらないようにする
+        os.set_blocking(self.__master, False)
+        self.port = os.ttyname(self.__slave)
+
+    def write(self, data) -> int:
+        size = super().write(data)
+        try:
+            os.write(self.__master, bytes(data))
+        except BlockingIOError:
+            pass
+        return size
+
+    def close(self):
+        if self.is_open:
+            os.close(self.__master)
+            os.close(self.__slave)
+        super().close()
@@ -27,6 +27,7 @@ from Camera import Camera
 import Settings
 from CommandLoader import CommandLoader
 from GuiAssets import CaptureArea, ControllerGUI
+from ImageProcessing import setDefaultMatchBackend
 from KeyConfig import PokeKeycon
 from Keyboard import SwitchKeyboardController
 from LineNotify import Line_Notify
@@ -250,7 +251,7 @@ class PokeControllerApp:
         self.serial_data_format_name_label = ttk.Label(self.serial_data_lf)
         self.serial_data_format_name_label.configure(anchor="center", text="Data Format: ")
         self.serial_data_format_name_label.grid(column="0", padx="5", pady="5", row="0", sticky="ew")
-        serial_data_format_list = ["Default", "Qingpi", "3DS Controller"]
+        serial_data_format_list = ["Default", "Default (Binary)", "Qingpi", "3DS Controller"]
         self.serial_data_format_name_cb = ttk.Combobox(self.serial_data_lf)
         self.serial_data_format_name = tk.StringVar(value="Default")
         self.serial_data_format_name_cb.configure(
@@ -1031,8 +1032,10 @@ class PokeControllerApp:
             self.camera_name_fromDLL.set("Unknown environment. Cannot show Camera name.")
             self.camera_name_cb.config(state="disable")
             self.camera_id_entry.config(state="normal")
+        # set up the template matching backend (cpu / opencl / cuda)
+        setDefaultMatchBackend(self.settings.template_match_backend.get())
         # open up a camera
-        self.camera = Camera(self.fps.get())
+        self.camera = Camera(self.fps.get(), use_grabber=self.settings.is_use_frame_grabber.get())
         self.openCamera()
         # activate serial communication
         try:
@@ -1049,7 +1052,11 @@ class PokeControllerApp:
         else:
             self.com_port_entry["state"] = "normal"
 
-        self.ser = Sender.Sender(self.is_show_serial)
+        self.ser = Sender.Sender(
+            self.is_show_serial,
+            use_writer=self.settings.is_use_serial_writer.get(),
+            coalesce=self.settings.is_coalesce_serial_write.get(),
+        )
         self.activateSerial()
         self.activateKeyboard()
         self.preview = CaptureArea(
@@ -1916,6 +1923,7 @@ class PokeControllerApp:
 
             self.settings.save()
 
+            self.preview.stopCapture()
             self.camera.destroy()
             cv2.destroyAllWindows()
             self._logger.debug("Stop Poke Controller")